@@ -0,0 +1,150 @@
+import os
+
+# === Общий кэш картинок и атлас значков ===
+# Каждая картинка декодируется один раз и сразу уменьшается до размера, в
+# котором её рисуют (аватар 1024x1024 на экране занимает 40x40). Мелкие
+# значки складываются в одну большую текстуру-атлас, маркеры получают
+# куски (region) этой текстуры. Без кэша у каждого виджета была бы своя
+# загрузка в видеопамять. С атласом все маркеры используют одну текстуру, и
+# между ними не нужно переключать текстуры. Отдельные draw call Kivy не
+# объединяет, поэтому в отчёте считаем загрузки и число разных текстур.
+ATLAS_SIZE = 512     # 1 МБ видеопамяти, помещается 16 значков 128x128 или ~150 по 40x40
+ATLAS_MAX_ICON = 128   # значки крупнее кладём отдельной текстурой
+PADDING = 1            # пустая полоса между значками, чтобы не было "подтёков" при масштабировании
+
+
+class ShelfPacker:
+    """Раскладка прямоугольников по полкам: полка высотой с самый высокий значок в ней"""
+
+    def __init__(self, width=ATLAS_SIZE, height=ATLAS_SIZE, padding=PADDING):
+        self.width = width
+        self.height = height
+        self.padding = padding
+        self._shelf_y = 0       # низ текущей полки
+        self._shelf_h = 0       # высота текущей полки
+        self._x = 0             # куда встанет следующий значок
+        self.used = 0           # занятая площадь
+
+    def place(self, w, h):
+        """Позиция (x, y) для прямоугольника w x h или None, если места нет"""
+        w, h = w + self.padding, h + self.padding
+        if self._x + w > self.width:
+            self._shelf_y += self._shelf_h
+            self._x, self._shelf_h = 0, 0
+        if w > self.width or self._shelf_y + h > self.height:
+            return None
+        x, y = self._x, self._shelf_y
+        self._x += w
+        self._shelf_h = max(self._shelf_h, h)
+        self.used += (w - self.padding) * (h - self.padding)
+        return x, y
+
+
+class AssetCache:
+    """Текстуры по (путь, размер): декодируются один раз, мелкие - в общем атласе"""
+
+    def __init__(self, atlas_size=ATLAS_SIZE):
+        self.atlas_size = atlas_size
+        self._textures = {}   # (путь, mtime, размер) -> (текстура, байт без кэша)
+        self._atlases = []    # [(текстура, упаковщик)]
+        self._standalone = 0
+        self.stats = {"requests": 0, "decodes": 0, "uploaded_bytes": 0, "naive_bytes": 0, "atlas_icons": 0}
+
+    def icon(self, path, size=None):
+        """Значок (маркер и т.п.): кусок атласа, если он небольшой"""
+        return self._get(path, size, atlas=True)
+
+    def texture(self, path, size=None):
+        """Отдельная текстура (аватары), уменьшенная до size, если он задан"""
+        return self._get(path, size, atlas=False)
+
+    def _get(self, path, size, atlas):
+        try:
+            key = (path, os.path.getmtime(path), tuple(size) if size else None)
+        except OSError:
+            return None  # как Image(source=...) с несуществующим файлом: пустое место
+        self.stats["requests"] += 1
+        cached = self._textures.get(key)
+        if cached is None:
+            image, original_bytes = self._decode(path, size)
+            if atlas and max(image.size) <= ATLAS_MAX_ICON:
+                texture = self._to_atlas(image)
+            else:
+                texture = self._upload(image)
+            cached = self._textures[key] = (texture, original_bytes)
+        # Столько без кэша загрузил бы каждый виджет, открыв файл сам
+        self.stats["naive_bytes"] += cached[1]
+        return cached[0]
+
+    def _decode(self, path, size):
+        from PIL import Image as PILImage
+
+        image = PILImage.open(path)
+        original_bytes = image.width * image.height * 4
+        image = image.convert("RGBA")
+        if size:
+            image.thumbnail(size, PILImage.LANCZOS)
+        self.stats["decodes"] += 1
+        # У текстур Kivy строки идут снизу вверх
+        return image.transpose(PILImage.FLIP_TOP_BOTTOM), original_bytes
+
+    def _upload(self, image):
+        from kivy.graphics.texture import Texture
+
+        texture = Texture.create(size=image.size, colorfmt="rgba")
+        texture.blit_buffer(image.tobytes(), colorfmt="rgba", bufferfmt="ubyte")
+        self.stats["uploaded_bytes"] += image.width * image.height * 4
+        self._standalone += 1
+        return texture
+
+    def _to_atlas(self, image):
+        from kivy.graphics.texture import Texture
+
+        for texture, packer in self._atlases:
+            pos = packer.place(*image.size)
+            if pos is not None:
+                break
+        else:
+            texture = Texture.create(size=(self.atlas_size, self.atlas_size), colorfmt="rgba")
+            packer = ShelfPacker(self.atlas_size, self.atlas_size)
+            self._atlases.append((texture, packer))
+            self.stats["uploaded_bytes"] += self.atlas_size * self.atlas_size * 4
+            pos = packer.place(*image.size)
+
+        texture.blit_buffer(image.tobytes(), colorfmt="rgba", bufferfmt="ubyte",
+                            pos=pos, size=image.size)
+        self.stats["atlas_icons"] += 1
+        return texture.get_region(pos[0], pos[1], *image.size)
+
+    def invalidate(self, path):
+        """Забыть картинку (например, после смены аватара). Место в атласе не освобождается"""
+        for key in [key for key in self._textures if key[0] == path]:
+            del self._textures[key]
+
+    def summary(self) -> str:
+        s = self.stats
+        textures = len(self._atlases) + self._standalone
+        saved = max(0, s["naive_bytes"] - s["uploaded_bytes"])
+        return (f"картинок запрошено: {s['requests']}, декодировано: {s['decodes']}, "
+                f"в атласе: {s['atlas_icons']}; видеопамять: {s['uploaded_bytes'] / 1024 / 1024:.1f} МБ "
+                f"вместо {s['naive_bytes'] / 1024 / 1024:.1f} МБ (экономия {saved / 1024 / 1024:.1f} МБ); "
+                f"разных текстур: {textures} вместо {s['requests']}")
+
+
+def image_widget(path, size, **kwargs):
+    """Виджет Image с общей текстурой, уменьшенной до размера виджета"""
+    from kivy.uix.image import Image
+
+    widget = Image(size_hint=(None, None), size=size, **kwargs)
+    widget.texture = get_assets().texture(path, size)
+    return widget
+
+
+_assets = None
+
+
+def get_assets() -> AssetCache:
+    global _assets
+    if _assets is None:
+        _assets = AssetCache()
+    return _assets
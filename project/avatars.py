@@ -0,0 +1,116 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image as PILImage, ImageOps, features
+
+# === Аватары в нескольких размерах ===
+# При загрузке аватара сразу готовим квадратные копии 32/50/128 px.
+# Интерфейс берёт ближайшую не меньшую копию под размер виджета, поэтому
+# вместо 1024x1024 с диска читается картинка на пару килобайт. Для уже
+# лежащих в avatars/ файлов есть пакетная обработка в пуле процессов.
+AVATAR_DIR = "avatars"
+THUMB_DIR = os.path.join(AVATAR_DIR, "thumbs")
+SIZES = (32, 50, 128)
+FORMAT = "webp" if features.check("webp") else "png"
+SOURCE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def variant_path(src, size, out_dir=THUMB_DIR):
+    name = os.path.splitext(os.path.basename(src))[0]
+    return os.path.join(out_dir, f"{name}_{size}.{FORMAT}")
+
+
+def _square(image, size):
+    """Квадрат из середины картинки размером size x size"""
+    # Сначала грубо и быстро уменьшаем в целое число раз, потом - LANCZOS
+    factor = min(image.size) // (size * 2)
+    if factor > 1:
+        image = image.reduce(factor)
+    return ImageOps.fit(image, (size, size), PILImage.LANCZOS)
+
+
+def make_variants(src, out_dir=THUMB_DIR, sizes=SIZES) -> dict:
+    """Готовит все размеры аватара: {размер: путь}"""
+    os.makedirs(out_dir, exist_ok=True)
+    image = PILImage.open(src)
+    image.draft("RGB", (max(sizes) * 2, max(sizes) * 2))  # JPEG декодируется сразу уменьшенным
+    image = ImageOps.exif_transpose(image).convert("RGBA")
+
+    paths = {}
+    for size in sorted(sizes, reverse=True):
+        path = variant_path(src, size, out_dir)
+        tmp_path = f"{path}.tmp"
+        _square(image, size).save(tmp_path, format=FORMAT.upper())
+        os.replace(tmp_path, path)  # интерфейс не увидит недописанный файл
+        paths[size] = path
+    return paths
+
+
+def _fresh(src, path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(src)
+
+
+def best_variant(src, px, out_dir=THUMB_DIR, sizes=SIZES):
+    """Наименьшая готовая копия не меньше px; если такой нет - сам файл"""
+    if not os.path.exists(src):
+        return src
+    for size in sorted(sizes):
+        if size >= px:
+            path = variant_path(src, size, out_dir)
+            if _fresh(src, path):
+                return path
+    return src
+
+
+def _sources(directory):
+    with os.scandir(directory) as entries:
+        return [entry.path for entry in entries
+                if entry.is_file() and entry.name.lower().endswith(SOURCE_EXTS)]
+
+
+def process_directory(directory=AVATAR_DIR, out_dir=THUMB_DIR, workers=None, force=False) -> int:
+    """Готовит копии для всех аватаров папки, у которых их нет или они устарели"""
+    todo = [src for src in _sources(directory)
+            if force or not all(_fresh(src, variant_path(src, size, out_dir)) for size in SIZES)]
+    if not todo:
+        return 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(make_variants, todo, [out_dir] * len(todo)))
+    return len(todo)
+
+
+def benchmark(directory=AVATAR_DIR, out_dir=THUMB_DIR, px=50, rounds=5):
+    """Время загрузки и память на аватар: исходный файл против копии под размер px"""
+    sources = _sources(directory)
+    if not sources:
+        print(f"В {directory} нет аватаров")
+        return
+    print(f"{'файл':<24} {'исходный, мс':>13} {'КБ в памяти':>12} {'копия, мс':>10} {'КБ в памяти':>12}")
+    for src in sources:
+        variant = best_variant(src, px, out_dir)
+        row = []
+        for path in (src, variant):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                with PILImage.open(path) as image:
+                    image = image.convert("RGBA")
+            row.append(((time.perf_counter() - start) / rounds * 1000, image.width * image.height * 4 / 1024))
+        print(f"{os.path.basename(src):<24} {row[0][0]:>13.1f} {row[0][1]:>12.0f} {row[1][0]:>10.1f} {row[1][1]:>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Копии аватаров в нескольких размерах")
+    parser.add_argument("--dir", default=AVATAR_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="пересоздать все копии")
+    parser.add_argument("--bench", action="store_true", help="сравнить загрузку исходников и копий")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    out_dir = os.path.join(args.dir, "thumbs")
+    done = process_directory(args.dir, out_dir, args.workers, args.force)
+    print(f"Обработано аватаров: {done} за {time.perf_counter() - start:.1f} с ({FORMAT})")
+    if args.bench:
+        benchmark(args.dir, out_dir)
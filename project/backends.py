@@ -0,0 +1,270 @@
+import os
+import sys
+import copy
+import time
+import argparse
+import threading
+
+# === Бэкенды для картиночной части CLIP ===
+# На машинах без видеокарты почти всё время проверки уходит на ViT-B/32 в
+# fp32. Кроме исходного PyTorch есть два варианта для CPU:
+#   int8 - динамическое квантование линейных слоёв (torch.ao.quantization);
+#   onnx - экспорт в ONNX и запуск через ONNX Runtime.
+# Текстовые эмбеддинги по-прежнему считает исходная модель: они кэшируются
+# (text_cache.py), и на скорость проверки не влияют. Выбор - переменная
+# окружения CLIP_BACKEND (torch / int8 / onnx), по умолчанию torch.
+# Перед сменой бэкенда стоит проверить точность:
+#   python backends.py parity samples/   (подпапки edible / not_edible / not_food)
+#   python backends.py bench
+BACKEND = os.environ.get("CLIP_BACKEND", "torch")
+CACHE_DIR = "clip_cache"
+ONNX_OPSET = 14
+MAX_ACCURACY_DROP = 0.01   # допустимая потеря точности вердиктов относительно fp32
+VERDICTS = ("edible", "not_edible", "not_food")
+
+
+def _normalize(features):
+    return features / features.norm(dim=-1, keepdim=True)
+
+
+class TorchEncoder:
+    """Исходная модель PyTorch (fp32 на CPU, fp16 на CUDA)"""
+    name = "torch"
+
+    def __init__(self, model, model_name, device):
+        self.visual = model.visual
+        self.dtype = model.dtype
+        self.device = device
+
+    def encode(self, batch):
+        """Нормированные эмбеддинги для пачки N x 3 x H x W"""
+        import torch
+
+        with torch.no_grad():
+            return _normalize(self.visual(batch.to(self.device, self.dtype)))
+
+
+class Int8Encoder(TorchEncoder):
+    """Копия картиночной части с весами линейных слоёв в int8 (только CPU)"""
+    name = "int8"
+
+    def __init__(self, model, model_name, device):
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        visual = copy.deepcopy(model.visual).float().eval()
+        self.visual = quantize_dynamic(visual, {torch.nn.Linear}, dtype=torch.qint8)
+        self.dtype = torch.float32
+        self.device = "cpu"
+
+
+def onnx_path(model_name, size, cache_dir=CACHE_DIR) -> str:
+    from text_cache import weights_hash
+
+    return os.path.join(cache_dir, f"visual_{weights_hash(model_name)[:16]}_{size}.onnx")
+
+
+def export_onnx(model, path, size):
+    """Экспортирует model.visual в ONNX с переменным размером пачки"""
+    import torch
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    visual = copy.deepcopy(model.visual).float().eval()
+    tmp_path = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(visual, torch.randn(1, 3, size, size), tmp_path,
+                          input_names=["image"], output_names=["features"],
+                          dynamic_axes={"image": {0: "batch"}, "features": {0: "batch"}},
+                          opset_version=ONNX_OPSET)
+    os.replace(tmp_path, path)
+
+
+class OnnxEncoder:
+    """Картиночная часть в ONNX Runtime; модель экспортируется один раз в clip_cache/"""
+    name = "onnx"
+
+    def __init__(self, model, model_name, device):
+        import onnxruntime as ort
+        from fast_decode import input_size
+
+        path = onnx_path(model_name, input_size(model))
+        if not os.path.exists(path):
+            print(f"Экспорт {model_name} в ONNX: {path}")
+            export_onnx(model, path, input_size(model))
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def encode(self, batch):
+        import torch
+
+        features = self.session.run(None, {self.input_name: batch.float().cpu().numpy()})[0]
+        return _normalize(torch.from_numpy(features))
+
+
+ENCODERS = {"torch": TorchEncoder, "int8": Int8Encoder, "onnx": OnnxEncoder}
+
+
+def make_encoder(model, model_name, device, backend=BACKEND):
+    """Кодировщик картинок выбранного бэкенда; если он недоступен - исходный PyTorch.
+    Какой бэкенд получился на самом деле - encoder.name"""
+    import torch
+    from fast_decode import input_size
+
+    if backend not in ENCODERS:
+        raise ValueError(f"Неизвестный бэкенд {backend!r}, есть: {', '.join(ENCODERS)}")
+    if backend != "torch" and str(device) != "cpu":
+        print(f"Бэкенд {backend} работает только на CPU, используем torch ({device})")
+        backend = "torch"
+    if backend == "torch":
+        return TorchEncoder(model, model_name, device)
+    try:
+        encoder = ENCODERS[backend](model, model_name, device)
+        # Пробный прогон: ошибки квантованных ядер или сессии ORT всплывут здесь, а не на фото пользователя
+        encoder.encode(torch.zeros(1, 3, input_size(model), input_size(model)))
+        return encoder
+    except Exception as e:  # нет пакета, не удался экспорт в ONNX, ошибка ORT
+        print(f"Бэкенд {backend} недоступен ({e}), используем torch")
+        return TorchEncoder(model, model_name, device)
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+_effective = {}  # (модель, запрошенный бэкенд) -> бэкенд, который реально создан
+
+
+def get_encoder(provider, backend=None):
+    """Один кодировщик на (провайдер, бэкенд); ждёт загрузки модели"""
+    backend = backend or BACKEND
+    model, _, device = provider.get()
+    with _encoders_lock:
+        key = (id(provider), backend)
+        if key not in _encoders:
+            _encoders[key] = make_encoder(model, provider.model_name, device, backend)
+            _effective[(provider.model_name, backend)] = _encoders[key].name
+        return _encoders[key]
+
+
+def model_id(model_name, backend=None, encoder=None) -> str:
+    """Идентификатор модели для кэша результатов: эмбеддинги бэкендов немного различаются.
+    Берётся бэкенд encoder, а без него - тот, что реально создал get_encoder (после
+    отката на torch ключ тоже torch); пока кодировщика нет - запрошенный"""
+    from text_cache import weights_hash
+
+    backend = backend or BACKEND
+    if encoder is not None:
+        backend = encoder.name
+    else:
+        backend = _effective.get((model_name, backend), backend)
+    suffix = "" if backend == "torch" else f"+{backend}"
+    return f"{model_name}@{weights_hash(model_name)[:12]}{suffix}"
+
+
+# === Проверка точности и скорости ===
+
+def labeled_samples(directory) -> list:
+    """[(путь, вердикт)] из подпапок directory/edible, not_edible, not_food"""
+    from batch_classify import iter_directory
+
+    samples = []
+    for label in VERDICTS:
+        folder = os.path.join(directory, label)
+        if os.path.isdir(folder):
+            samples.extend((path, label) for path in iter_directory(folder))
+    return samples
+
+
+def parity(directory, backends=tuple(ENCODERS), batch_size=32) -> bool:
+    """Сравнивает бэкенды с fp32 на размеченных фото; False, если точность упала больше допуска"""
+    import torch
+    from clip_model import MODEL_NAME, get_provider
+    from fast_decode import input_size, load_tensor
+    from food_classifier import FoodClassifier
+
+    samples = labeled_samples(directory)
+    if not samples:
+        print(f"В {directory} нет размеченных фото (подпапки {', '.join(VERDICTS)})")
+        return False
+    classifier = FoodClassifier(provider=get_provider(MODEL_NAME, "cpu"))
+    model, _, device = classifier.provider.get()
+    text_features = classifier.text_features()
+    images = [load_tensor(path, input_size(model)) for path, _ in samples]
+    labels = [label for _, label in samples]
+
+    results = {}
+    for backend in ("torch",) + tuple(b for b in backends if b != "torch"):
+        encoder = make_encoder(model, MODEL_NAME, device, backend)
+        if encoder.name != backend:
+            continue  # бэкенд недоступен, сравнивать не с чем
+        features = torch.cat([encoder.encode(torch.stack(images[i:i + batch_size]))
+                              for i in range(0, len(images), batch_size)]).float()
+        results[backend] = (features, features @ text_features.float().T)
+
+    base_features, base_scores = results["torch"]
+    base_top = base_scores.argmax(dim=-1)
+    base_accuracy = sum(classifier.verdicts[i] == label for i, label in zip(base_top.tolist(), labels)) / len(labels)
+
+    ok = True
+    print(f"фото: {len(samples)}")
+    print(f"{'бэкенд':<8} {'точность':>9} {'совпадает с fp32':>17} {'макс. разница оценок':>21} {'косинус с fp32':>15}")
+    for backend, (features, scores) in results.items():
+        top = scores.argmax(dim=-1)
+        accuracy = sum(classifier.verdicts[i] == label for i, label in zip(top.tolist(), labels)) / len(labels)
+        agreement = (top == base_top).float().mean().item()
+        max_diff = (scores - base_scores).abs().max().item()
+        cosine = (features * base_features).sum(dim=-1).mean().item()
+        passed = accuracy >= base_accuracy - MAX_ACCURACY_DROP
+        ok = ok and passed
+        print(f"{backend:<8} {accuracy:>9.1%} {agreement:>17.1%} {max_diff:>21.4f} {cosine:>15.5f}"
+              f"{'' if passed else '  <- точность ниже допуска'}")
+    return ok
+
+
+def bench(backends=tuple(ENCODERS), rounds=30, batch_size=32):
+    """Задержка одного фото (p50/p95) и пропускная способность пачками на CPU"""
+    import torch
+    from clip_model import MODEL_NAME, get_provider
+    from fast_decode import input_size
+
+    model, _, device = get_provider(MODEL_NAME, "cpu").get()
+    size = input_size(model)
+    single = torch.randn(1, 3, size, size)
+    batch = torch.randn(batch_size, 3, size, size)
+
+    print(f"потоков torch: {torch.get_num_threads()}, пачка: {batch_size}")
+    print(f"{'бэкенд':<8} {'p50, мс':>9} {'p95, мс':>9} {'фото/с пачкой':>14}")
+    for backend in backends:
+        encoder = make_encoder(model, MODEL_NAME, device, backend)
+        if encoder.name != backend:
+            continue
+        encoder.encode(single)  # прогрев
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            encoder.encode(single)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        start = time.perf_counter()
+        for _ in range(3):
+            encoder.encode(batch)
+        throughput = 3 * batch_size / (time.perf_counter() - start)
+        print(f"{backend:<8} {times[len(times) // 2] * 1000:>9.1f} "
+              f"{times[int(len(times) * 0.95)] * 1000:>9.1f} {throughput:>14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бэкенды CLIP: проверка точности и скорости")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("parity", help="сравнить вердикты бэкендов с fp32 на размеченных фото")
+    p.add_argument("directory")
+    p.add_argument("--backends", nargs="+", default=list(ENCODERS), choices=list(ENCODERS))
+    b = sub.add_parser("bench", help="задержка и пропускная способность")
+    b.add_argument("--backends", nargs="+", default=list(ENCODERS), choices=list(ENCODERS))
+    b.add_argument("--rounds", type=int, default=30)
+    b.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.command == "parity":
+        sys.exit(0 if parity(args.directory, args.backends) else 1)
+    bench(args.backends, args.rounds, args.batch_size)
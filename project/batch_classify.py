@@ -0,0 +1,180 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backends import BACKEND, ENCODERS
+from clip_model import MODEL_NAME, get_provider
+from fast_decode import input_size, load_tensor
+from food_classifier import TTA_MARGIN, FoodClassifier
+
+# === Пакетная проверка еды (без интерфейса) ===
+# Пример: python batch_classify.py photos/ --out results.jsonl --batch-size 32
+# Повторный прогон: --previous results.jsonl - фото, в которых прошлый раз
+# модель была уверена не меньше --skip-confidence, не проверяются заново.
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+SKIP_CONFIDENCE = 0.9
+
+
+def iter_directory(path):
+    """Лениво обходит папку и отдаёт пути к картинкам"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def iter_manifest(path):
+    """Читает список путей из файла (по одному на строку)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def load_image(size, path):
+    """Декодирует и готовит одну картинку (выполняется в пуле потоков)"""
+    try:
+        return path, load_tensor(path, size), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def iter_preprocessed(paths, size, workers):
+    """Декодирование в пуле потоков с ограниченным числом задач в полёте"""
+    max_in_flight = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(load_image, size, path))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ResultWriter:
+    """Пишет строки результата в JSONL или CSV (по расширению файла)"""
+    FIELDS = ["path", "label", "verdict", "score", "confidence", "error"]
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8", newline="") if path != "-" else sys.stdout
+        self.csv = None
+        if path.lower().endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, fieldnames=self.FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            self.csv.writerow(row)
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def load_previous(path) -> dict:
+    """Строки прошлого результата (JSONL или CSV): {путь: строка}"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = csv.DictReader(f) if path.lower().endswith(".csv") else (json.loads(line) for line in f if line.strip())
+        return {row["path"]: row for row in rows}
+
+
+def _confident(row, threshold) -> bool:
+    try:
+        return not row.get("error") and float(row.get("confidence") or 0) >= threshold
+    except ValueError:
+        return False
+
+
+def run(paths, out_path, batch_size=32, workers=4, device=None, backend=BACKEND, tta_margin=TTA_MARGIN,
+        previous=None, skip_confidence=SKIP_CONFIDENCE):
+    """Классифицирует все картинки из paths и пишет результат в out_path"""
+    classifier = FoodClassifier(provider=get_provider(MODEL_NAME, device), backend=backend, tta_margin=tta_margin)
+    model, _, _ = classifier.provider.get()
+
+    writer = ResultWriter(out_path)
+    done = skipped = 0
+
+    def fresh_paths():
+        # Уверенные прошлые ответы переписываем как есть, модель для них не нужна
+        nonlocal skipped
+        for path in paths:
+            row = previous.get(path) if previous else None
+            if row is not None and _confident(row, skip_confidence):
+                writer.write({field: row.get(field) for field in ResultWriter.FIELDS})
+                skipped += 1
+            else:
+                yield path
+    start = time.perf_counter()
+    batch_paths, batch_images = [], []
+
+    def flush():
+        nonlocal done
+        predictions = classifier.refine(batch_paths, classifier.classify_batch(batch_images))
+        for path, prediction in zip(batch_paths, predictions):
+            writer.write({"path": path, "label": prediction.label, "verdict": prediction.verdict,
+                          "score": round(prediction.score, 4), "confidence": round(prediction.confidence, 4),
+                          "error": None})
+        done += len(batch_paths)
+        batch_paths.clear()
+        batch_images.clear()
+        elapsed = time.perf_counter() - start
+        print(f"\rОбработано: {done} ({done / elapsed:.1f} img/s)", end="", file=sys.stderr)
+
+    try:
+        for path, image, error in iter_preprocessed(fresh_paths(), input_size(model), workers):
+            if error is not None:
+                writer.write({"path": path, "label": None, "verdict": None, "score": None, "confidence": None,
+                              "error": error})
+                continue
+            batch_paths.append(path)
+            batch_images.append(image)
+            if len(batch_images) >= batch_size:
+                flush()
+        if batch_images:
+            flush()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print(f"Готово: {done} картинок за {elapsed:.1f} с ({done / max(elapsed, 1e-9):.1f} img/s)"
+          f"{f', взято из прошлого результата: {skipped}' if skipped else ''}", file=sys.stderr)
+    return done, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная проверка фотографий еды через CLIP")
+    parser.add_argument("directory", nargs="?", help="папка с фотографиями")
+    parser.add_argument("--manifest", help="файл со списком путей (по одному на строку)")
+    parser.add_argument("--out", default="-", help="куда писать результат: *.jsonl, *.csv или - (stdout)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--backend", default=BACKEND, choices=list(ENCODERS),
+                        help="torch, int8 или onnx (по умолчанию CLIP_BACKEND)")
+    parser.add_argument("--tta-margin", type=float, default=TTA_MARGIN,
+                        help="перепроверять по нескольким видам фото с меньшим отрывом (0 - не перепроверять)")
+    parser.add_argument("--previous", help="прошлый результат (*.jsonl или *.csv): уверенные ответы не пересчитывать")
+    parser.add_argument("--skip-confidence", type=float, default=SKIP_CONFIDENCE)
+    args = parser.parse_args()
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("укажите либо папку, либо --manifest")
+    paths = iter_manifest(args.manifest) if args.manifest else iter_directory(args.directory)
+    previous = load_previous(args.previous) if args.previous else None
+    run(paths, args.out, args.batch_size, args.workers, args.device, args.backend, args.tta_margin,
+        previous, args.skip_confidence)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import deque
+
+from chat_store import ChatStore, PAGE_SIZE
+
+# === Сервер-ретранслятор чата ===
+# Простой протокол поверх TCP: одна JSON-строка на сообщение.
+#   клиент -> сервер: {"type": "hello", "since": <id или null>}
+#                     {"type": "send", "user": ..., "text": ...}
+#                     {"type": "page", "before": <id>}
+#   сервер -> клиент: {"type": "history", "messages": [...]}
+#                     {"type": "page", "messages": [...]}
+#                     {"type": "message", "message": {...}}
+# Исходящие строки копятся в буфере клиента и уходят одной записью,
+# поэтому при всплеске сообщений на клиента приходится мало системных вызовов.
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_PENDING = 10000  # сообщений в очереди медленного клиента, дальше - отключаем
+MAX_TEXT = 2000      # символов в сообщении, длиннее - обрезаем до записи в историю
+MAX_HISTORY = 500    # сообщений в одном ответе history/page
+REQUEST_LIMIT = 64 * 1024      # байт в строке от клиента: запросы короткие
+RESPONSE_LIMIT = 8 * 1024 * 1024  # байт в строке от сервера: MAX_HISTORY сообщений по MAX_TEXT символов
+
+
+def encode(message) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _Subscriber:
+    """Подключённый клиент с буфером исходящих сообщений"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.flusher = asyncio.ensure_future(self._flush_loop())
+
+    def send(self, data: bytes):
+        if self.closed:
+            return
+        if len(self.pending) >= MAX_PENDING:
+            self.close()
+            return
+        self.pending.append(data)
+        self.wakeup.set()
+
+    async def _flush_loop(self):
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                if not self.pending:
+                    continue
+                data, self.pending = b"".join(self.pending), []
+                self.writer.write(data)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.wakeup.set()
+            self.writer.close()
+
+
+class RelayServer:
+    """Рассылает новые сообщения всем подписчикам и отдаёт историю из ChatStore"""
+
+    def __init__(self, store=None, host=HOST, port=PORT):
+        self.store = store or ChatStore()
+        self.host = host
+        self.port = port
+        self.subscribers = set()
+        self.server = None
+        self._handlers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, limit=REQUEST_LIMIT)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        flushers = [subscriber.flusher for subscriber in self.subscribers]
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+        await asyncio.gather(*self._handlers, *flushers, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    def broadcast(self, message):
+        data = encode(message)
+        for subscriber in list(self.subscribers):
+            subscriber.send(data)
+
+    async def _handle(self, reader, writer):
+        subscriber = _Subscriber(writer)
+        self.subscribers.add(subscriber)
+        self._handlers.add(asyncio.current_task())
+        try:
+            while not subscriber.closed:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    break  # строка длиннее REQUEST_LIMIT - отключаем только этого клиента
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if isinstance(request, dict):
+                        self._dispatch(subscriber, request)
+                except (TypeError, ValueError):
+                    continue  # кривой запрос пропускаем, соединение оставляем
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            self._handlers.discard(asyncio.current_task())
+            subscriber.close()
+
+    def _dispatch(self, subscriber, request):
+        kind = request.get("type")
+        if kind == "hello":
+            since = request.get("since")
+            if since is None:
+                messages = self.store.page()
+            else:
+                # после долгого обрыва отдаём только последние MAX_HISTORY
+                messages = self.store.since(max(int(since), self.store.last_id - MAX_HISTORY))
+            subscriber.send(encode({"type": "history", "messages": messages}))
+        elif kind == "page":
+            limit = min(int(request.get("limit", PAGE_SIZE)), MAX_HISTORY)
+            messages = self.store.page(before=request.get("before"), limit=limit)
+            subscriber.send(encode({"type": "page", "messages": messages}))
+        elif kind == "send":
+            text = str(request.get("text", "")).strip()[:MAX_TEXT]
+            if text:
+                record = self.store.append(str(request.get("user")), text)
+                self.broadcast({"type": "message", "message": record})
+
+
+class AsyncRelayClient:
+    """Асинхронный клиент (используется в бенчмарке и внутри RelayClient)"""
+
+    def __init__(self, host=HOST, port=PORT):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, since=None):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=RESPONSE_LIMIT)
+        await self.request({"type": "hello", "since": since})
+
+    async def request(self, message):
+        self.writer.write(encode(message))
+        await self.writer.drain()
+
+    async def send(self, user, text):
+        await self.request({"type": "send", "user": user, "text": text})
+
+    async def receive(self):
+        """Следующее сообщение от сервера или None, если соединение закрыто"""
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class RelayClient:
+    """Клиент для интерфейса: свой event loop в фоновом потоке, переподключение.
+
+    on_event(message) вызывается из фонового потока, интерфейс сам
+    переносит его в главный поток (в Kivy - через Clock.schedule_once).
+    Сообщения, отправленные без связи, ждут в очереди и уходят после
+    переподключения.
+    """
+
+    def __init__(self, on_event, host=HOST, port=PORT, retry_seconds=2.0):
+        self.on_event = on_event
+        self.host = host
+        self.port = port
+        self.retry_seconds = retry_seconds
+        self.last_seen = None
+        self.connected = False
+        self._client = None
+        self._outbox = deque()   # неотправленные сообщения; трогаем только из потока event loop
+        self._send_lock = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="chat-relay", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    async def _run(self):
+        while True:
+            try:
+                self._client = AsyncRelayClient(self.host, self.port)
+                await self._client.connect(since=self.last_seen)
+                self.connected = True
+                await self._flush_outbox()
+                while True:
+                    message = await self._client.receive()
+                    if message is None:
+                        break
+                    self._remember(message)
+                    self.on_event(message)
+            except (OSError, ValueError):
+                pass  # ValueError - слишком длинная или битая строка: переподключаемся
+            finally:
+                self.connected = False
+                if self._client is not None:
+                    await self._client.close()
+            await asyncio.sleep(self.retry_seconds)
+
+    def _remember(self, message):
+        """Запоминаем последний полученный номер, чтобы после обрыва получить только дельту"""
+        if message.get("type") == "message":
+            ids = [message["message"]["id"]]
+        elif message.get("type") == "history":
+            ids = [m["id"] for m in message["messages"]]
+        else:
+            return
+        if ids:
+            self.last_seen = max(ids + [self.last_seen if self.last_seen is not None else -1])
+
+    async def _flush_outbox(self):
+        if self._send_lock is None:
+            self._send_lock = asyncio.Lock()  # создаём в потоке event loop
+        async with self._send_lock:
+            while self._outbox and self.connected:
+                await self._client.request(self._outbox[0])
+                self._outbox.popleft()  # убираем только после записи: при обрыве уйдёт повторно
+
+    def _request(self, message):
+        async def go():
+            if self.connected:
+                await self._client.request(message)
+        asyncio.run_coroutine_threadsafe(go(), self._loop)
+
+    def send(self, user, text) -> bool:
+        """Отправляет сообщение; False - связи нет, оно уйдёт после переподключения"""
+        async def go():
+            self._outbox.append({"type": "send", "user": user, "text": text})
+            await self._flush_outbox()
+        asyncio.run_coroutine_threadsafe(go(), self._loop)
+        return self.connected
+
+    def request_page(self, before, limit=PAGE_SIZE):
+        self._request({"type": "page", "before": before, "limit": limit})
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def benchmark(clients=50, messages=1000, senders=1):
+    """Нагрузочный тест: N клиентов в этом же процессе, задержка доставки и скорость"""
+    with tempfile.TemporaryDirectory() as tmp:
+        server = await RelayServer(ChatStore(os.path.join(tmp, "chat.jsonl")), port=0).start()
+        receivers = [AsyncRelayClient(port=server.port) for _ in range(clients)]
+        for client in receivers:
+            await client.connect()
+            await client.receive()  # пустая история
+
+        sent_at = {}
+        latencies = []
+
+        async def consume(client):
+            got = 0
+            while got < messages:
+                event = await client.receive()
+                if event is None:
+                    break
+                if event["type"] == "message":
+                    latencies.append(time.perf_counter() - sent_at[event["message"]["text"]])
+                    got += 1
+
+        async def produce(sender, index):
+            for i in range(index, messages, senders):
+                text = f"bench-{i}"
+                sent_at[text] = time.perf_counter()
+                await sender.send("bench", text)
+
+        producers = [AsyncRelayClient(port=server.port) for _ in range(senders)]
+        for sender in producers:
+            await sender.connect()
+
+        start = time.perf_counter()
+        consumers = [asyncio.ensure_future(consume(c)) for c in receivers]
+        await asyncio.gather(*(produce(s, i) for i, s in enumerate(producers)))
+        await asyncio.gather(*consumers)
+        elapsed = time.perf_counter() - start
+
+        for client in receivers + producers:
+            await client.close()
+        await server.close()
+        server.store.close()
+
+    print(f"клиентов: {clients}, сообщений: {messages}, отправителей: {senders}")
+    print(f"  сообщений/с (принято сервером): {messages / elapsed:.0f}")
+    print(f"  доставок/с (всем клиентам):     {len(latencies) / elapsed:.0f}")
+    print(f"  задержка p50: {percentile(latencies, 0.50) * 1000:.2f} мс, "
+          f"p99: {percentile(latencies, 0.99) * 1000:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ретранслятор чата для msngr.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="запустить сервер")
+    serve.add_argument("--host", default=HOST)
+    serve.add_argument("--port", type=int, default=PORT)
+
+    bench = sub.add_parser("bench", help="нагрузочный тест с клиентами в этом же процессе")
+    bench.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100])
+    bench.add_argument("--messages", type=int, default=1000)
+    bench.add_argument("--senders", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        async def serve_forever():
+            server = await RelayServer(host=args.host, port=args.port).start()
+            print(f"Чат-сервер запущен на {server.host}:{server.port}")
+            await server.server.serve_forever()
+        asyncio.run(serve_forever())
+    else:
+        for clients in args.clients:
+            asyncio.run(benchmark(clients, args.messages, args.senders))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from file_lock import locked_file
+
+# === История чата: журнал с дозаписью и постраничным чтением ===
+# Каждое сообщение - одна JSON-строка в chat_log.jsonl. Смещения строк держим
+# в памяти, поэтому отправка стоит O(1), а любую страницу истории можно
+# прочитать без чтения всего файла. Аватар в сообщении не хранится - только
+# логин, картинку интерфейс находит сам.
+# Один журнал могут открыть несколько приложений сразу (msngr.py, test,
+# chat_relay.py): запись и сжатие идут под блокировкой файла <журнал>.lock,
+# перед каждой операцией дочитываются строки других процессов, а если журнал
+# подменили сжатием в другом процессе - он открывается заново.
+LOG_PATH = "chat_log.jsonl"
+LEGACY_PATH = "chat_messages.json"  # старый формат: один JSON-массив на весь чат
+PAGE_SIZE = 50
+
+FSYNC_EVERY = 32       # fsync не на каждое сообщение, а пачками...
+FSYNC_INTERVAL = 1.0   # ...но не позже, чем через столько секунд после сообщения (по таймеру)
+
+
+class ChatStore:
+    """Журнал сообщений чата"""
+
+    def __init__(self, path=LOG_PATH, legacy_path=LEGACY_PATH, fsync_every=FSYNC_EVERY,
+                 fsync_interval=FSYNC_INTERVAL, max_messages=None):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_messages = max_messages  # None - хранить всё; иначе старые уходят при сжатии
+        self._lock = threading.Lock()
+        self._base = 0        # номер первого сообщения в файле
+        self._offsets = []
+        self._end = 0         # до какого байта журнал прочитан
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._timer = None    # отложенный fsync для сообщений, после которых наступила тишина
+        self._writer = self._reader = None
+        self._lock_file = open(path + ".lock", "a+b")
+
+        with self._exclusive():
+            if not self._offsets and legacy_path and os.path.exists(legacy_path):
+                self._import_locked(legacy_path)
+
+    @contextmanager
+    def _exclusive(self):
+        """Блокировка и между потоками, и между процессами; журнал дочитан до конца"""
+        with self._lock, locked_file(self._lock_file):
+            self._refresh(truncate=True)
+            yield
+
+    def _refresh(self, truncate=False):
+        """Дочитывает строки, дописанные после прошлого чтения (в том числе другими процессами).
+        truncate=True (только под _exclusive) обрезает недописанный хвост после сбоя"""
+        if self._reader is None or self._replaced():
+            self._open()
+        size = os.fstat(self._reader.fileno()).st_size
+        if size == self._end:
+            return
+        self._reader.seek(self._end)
+        for line in self._reader:
+            if not line.endswith(b"\n"):
+                break  # другой процесс ещё пишет эту строку (или упал посреди записи)
+            if not self._offsets:
+                self._base = json.loads(line)["id"]
+            self._offsets.append(self._end)
+            self._end += len(line)
+        if truncate and self._end != size:
+            self._writer.truncate(self._end)
+
+    def _replaced(self) -> bool:
+        """Журнал подменён сжатием в другом процессе: наши дескрипторы смотрят на старый файл"""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._reader.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _open(self):
+        """(Пере)открывает журнал; прочитан он будет заново, с начала"""
+        if self._reader is not None:
+            self._writer.close()
+            self._reader.close()
+        self._writer = open(self.path, "ab")
+        self._reader = open(self.path, "rb")
+        self._offsets = []
+        self._end = 0
+        self._unsynced = 0
+
+    def import_legacy(self, legacy_path=LEGACY_PATH) -> int:
+        """Переносит сообщения из старого chat_messages.json (аватары не переносятся)"""
+        with self._exclusive():
+            return self._import_locked(legacy_path)
+
+    def _import_locked(self, legacy_path):
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            messages = json.load(f)
+        for message in messages:
+            self._append_locked(message.get("username"), message.get("text", ""), sync=False)
+        self._sync_locked()
+        return len(messages)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    @property
+    def first_id(self) -> int:
+        """Номер самого раннего хранимого сообщения"""
+        return self._base
+
+    @property
+    def last_id(self) -> int:
+        """Номер последнего сообщения (-1, если чат пуст)"""
+        return self._base + len(self._offsets) - 1
+
+    def append(self, user: str, text: str, sync=True) -> dict:
+        """Дописывает сообщение в конец журнала и возвращает его"""
+        with self._exclusive():
+            return self._append_locked(user, text, sync)
+
+    def _append_locked(self, user, text, sync=True):
+        record = {"id": self._base + len(self._offsets), "user": user, "text": text,
+                  "ts": round(time.time(), 3)}
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self._writer.seek(0, os.SEEK_END)
+        offset = self._writer.tell()
+        self._writer.write(line)
+        self._writer.flush()
+        self._offsets.append(offset)
+        self._end = offset + len(line)
+
+        self._unsynced += 1
+        if sync:
+            waited = time.monotonic() - self._last_sync
+            if self._unsynced >= self.fsync_every or waited >= self.fsync_interval:
+                self._sync_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval - waited, self._timed_sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if self.max_messages and len(self._offsets) > self.max_messages * 3 // 2:
+            self._compact_locked(self.max_messages)
+        return record
+
+    def sync(self):
+        """Принудительно сбрасывает журнал на диск"""
+        with self._lock:
+            self._sync_locked()
+
+    def _timed_sync(self):
+        with self._lock:
+            self._timer = None
+            if not self._writer.closed:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        if self._unsynced:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def compact(self, keep_last=None):
+        """Переписывает журнал в новый файл (оставляя keep_last последних) и атомарно подменяет"""
+        with self._exclusive():
+            self._compact_locked(keep_last)
+
+    def _compact_locked(self, keep_last=None):
+        start = 0 if keep_last is None else max(0, len(self._offsets) - keep_last)
+        tmp_path = self.path + ".tmp"
+        self._writer.flush()
+        with open(tmp_path, "wb") as out:
+            if start < len(self._offsets):
+                self._reader.seek(self._offsets[start])
+                for _ in range(start, len(self._offsets)):
+                    record = json.loads(self._reader.readline())
+                    out.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            out.flush()
+            os.fsync(out.fileno())
+
+        os.replace(tmp_path, self.path)
+        self._base += start
+        self._open()
+        self._refresh()
+
+    def _read(self, start, stop):
+        """Читает сообщения с номерами [start, stop)"""
+        start = max(start, self._base)
+        stop = min(stop, self._base + len(self._offsets))
+        if start >= stop:
+            return []
+        self._reader.seek(self._offsets[start - self._base])
+        return [json.loads(self._reader.readline()) for _ in range(start, stop)]
+
+    def page(self, before=None, limit=PAGE_SIZE) -> list:
+        """Страница истории перед сообщением before (по умолчанию - последние), от старых к новым"""
+        with self._lock:
+            self._refresh()
+            stop = self.last_id + 1 if before is None else before
+            return self._read(stop - limit, stop)
+
+    def since(self, last_seen, limit=None) -> list:
+        """Сообщения с номером больше last_seen"""
+        with self._lock:
+            self._refresh()
+            start = last_seen + 1
+            stop = self.last_id + 1 if limit is None else start + limit
+            return self._read(start, stop)
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._sync_locked()
+            self._writer.close()
+            self._reader.close()
+            self._lock_file.close()
@@ -0,0 +1,119 @@
+import time
+import threading
+
+# === Общая ленивая загрузка CLIP ===
+# Модель грузится в фоновом потоке только тогда, когда она действительно нужна
+# (экран проверки еды или кнопка в tk.py), поэтому окно открывается сразу.
+MODEL_NAME = "ViT-B/32"
+
+
+class ModelProvider:
+    """Загружает CLIP один раз в фоне и отдаёт его всем экранам"""
+
+    def __init__(self, model_name=MODEL_NAME, device=None):
+        self.model_name = model_name
+        self.device = device
+        self.model = None
+        self.preprocess = None
+        self.error = None
+        self.metrics = {"state": "idle"}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._callbacks = []
+
+    @property
+    def state(self) -> str:
+        """idle / warming / ready / error"""
+        return self.metrics["state"]
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.error is None
+
+    def start(self, callback=None):
+        """Запускает загрузку (если ещё не запущена); callback(provider) вызовется из фонового потока.
+        После ошибки повторный вызов пробует загрузить модель заново"""
+        with self._lock:
+            if self.error is not None and self._ready.is_set():
+                # Веса могли не скачаться или не хватило памяти: не требуем перезапуска приложения
+                self.error = None
+                self.metrics.pop("error", None)
+                self._ready.clear()
+                self._thread = None
+            if callback is not None:
+                if self._ready.is_set():
+                    run_now = True
+                else:
+                    self._callbacks.append(callback)
+                    run_now = False
+            else:
+                run_now = False
+
+            if self._thread is None:
+                self.metrics["state"] = "warming"
+                self.metrics["requested_at"] = time.time()
+                self._thread = threading.Thread(target=self._load, name="clip-loader", daemon=True)
+                self._thread.start()
+
+        if run_now:
+            callback(self)
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            import torch
+            import clip
+
+            t1 = time.perf_counter()
+            device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+            model, preprocess = clip.load(self.model_name, device=device)
+            t2 = time.perf_counter()
+
+            self.model, self.preprocess, self.device = model, preprocess, device
+            self.metrics.update({
+                "state": "ready",
+                "device": device,
+                "import_seconds": round(t1 - t0, 3),
+                "load_seconds": round(t2 - t1, 3),
+                "total_seconds": round(t2 - t0, 3),
+                "ready_at": time.time(),
+            })
+            print(f"CLIP {self.model_name} загружена за {t2 - t0:.1f} с ({device})")
+        except Exception as e:
+            self.error = e
+            self.metrics.update({"state": "error", "error": str(e)})
+            print(f"Не удалось загрузить CLIP: {e}")
+
+        with self._lock:
+            self._ready.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def get(self, timeout=None):
+        """Возвращает (model, preprocess, device), при необходимости дожидаясь загрузки"""
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("CLIP ещё загружается")
+        if self.error is not None:
+            raise RuntimeError("CLIP не загружена") from self.error
+        return self.model, self.preprocess, self.device
+
+
+def needs_start(provider) -> bool:
+    """Загрузку ещё не начинали или она упала - экрану пора вызвать start() (ModelProvider и RemoteProvider)"""
+    return provider.state in ("idle", "error")
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(model_name=MODEL_NAME, device=None) -> ModelProvider:
+    """Один общий провайдер на (модель, устройство) в пределах процесса"""
+    with _providers_lock:
+        key = (model_name, device)
+        if key not in _providers:
+            _providers[key] = ModelProvider(model_name, device)
+        return _providers[key]
@@ -0,0 +1,564 @@
+import os
+import json
+import time
+import argparse
+import threading
+
+import numpy as np
+
+# === Поиск повторно отправленных фото ===
+# Нормированные эмбеддинги CLIP всех отправленных фото лежат в индексе.
+# Новое фото сравнивается с историей по косинусу (для нормированных векторов
+# это просто скалярное произведение). Копия того же фото, пережатая,
+# обрезанная или с фильтром, даёт сходство выше DUP_THRESHOLD.
+# Пока фото немного, хватает полного перебора одной матрицей NumPy. После
+# IVF_THRESHOLD векторов индекс перестраивается в IVF: векторы разложены по
+# кластерам k-means, запрос сравнивается с центрами и просматривает только
+# NPROBE ближайших кластеров. Кластеров ~ 2 sqrt(N); когда история вырастает
+# в RETRAIN_GROWTH раз с последнего обучения, центры обучаются заново, иначе
+# кластеры разбухают и поиск замедляется. Переобучение идёт в фоновом потоке
+# по снимку векторов, поиск тем временем работает по старому индексу (пока
+# строится новый, векторы в памяти дважды: на 1M пик ~5 ГБ). Списки кластеров
+# хранятся блоками по BLOCK_ROWS строк, чтобы рост не копировал их и не
+# дробил кучу. На 1M векторов, выращенных с нуля (2000 кластеров), поиск
+# ~0.9 мс против ~300 мс полным перебором (python dup_index.py bench).
+# История хранится в папке DUP_DIR: векторы дописываются в vectors.f16,
+# описания - в meta.jsonl (после векторов). При открытии оба файла обрезаются
+# до числа целых пар, так что обрыв между двумя записями не сдвигает векторы
+# относительно описаний.
+DUP_DIR = "dup_index"
+DIM = 512                 # ViT-B/32
+DUP_THRESHOLD = 0.95
+IVF_THRESHOLD = 10000
+RETRAIN_GROWTH = 2
+NPROBE = 4
+KMEANS_SAMPLE = 20000
+KMEANS_ITERS = 8
+BLOCK_ROWS = 128          # строк в блоке списка IVF (256 КБ)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def _top_k(scores, ids, k):
+    if k == 1:
+        best = int(scores.argmax())
+        return [(float(scores[best]), int(ids[best]))]
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[part], ids[part]
+    order = np.argsort(-scores)
+    return [(float(scores[i]), int(ids[i])) for i in order]
+
+
+class _Growable:
+    """Массив N x dim с запасом места: добавление без копирования всего массива каждый раз"""
+
+    def __init__(self, dim, capacity=1024):
+        self.data = np.empty((capacity, dim), dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def extend(self, vectors, ids):
+        need = self.size + len(vectors)
+        if need > len(self.data):
+            capacity = max(need, len(self.data) * 2)
+            data = np.empty((capacity, self.data.shape[1]), dtype=np.float32)
+            data[:self.size] = self.data[:self.size]
+            new_ids = np.empty(capacity, dtype=np.int64)
+            new_ids[:self.size] = self.ids[:self.size]
+            self.data, self.ids = data, new_ids
+        self.data[self.size:need] = vectors
+        self.ids[self.size:need] = ids
+        self.size = need
+
+    def search(self, query, k):
+        if self.size == 0:
+            return []
+        return _top_k(self.data[:self.size] @ query, self.ids[:self.size], k)
+
+
+class _Blocks:
+    """Список IVF: векторы блоками по BLOCK_ROWS строк. Рост - новый блок, старые не копируются,
+    а освободившиеся блоки одного размера куча отдаёт другим спискам и следующему индексу"""
+
+    def __init__(self, dim, rows=BLOCK_ROWS):
+        self.dim = dim
+        self.rows = rows
+        self.blocks = []  # [(векторы, id)], заполнен не до конца только последний
+        self.size = 0
+
+    def extend(self, vectors, ids):
+        done = 0
+        while done < len(vectors):
+            used = self.size - (len(self.blocks) - 1) * self.rows if self.blocks else self.rows
+            if used == self.rows:
+                self.blocks.append((np.empty((self.rows, self.dim), dtype=np.float32),
+                                    np.empty(self.rows, dtype=np.int64)))
+                used = 0
+            data, block_ids = self.blocks[-1]
+            take = min(self.rows - used, len(vectors) - done)
+            data[used:used + take] = vectors[done:done + take]
+            block_ids[used:used + take] = ids[done:done + take]
+            done += take
+            self.size += take
+
+    def parts(self) -> list:
+        """[(векторы, id)] заполненной части блоков без копирования"""
+        if not self.blocks:
+            return []
+        last = self.size - (len(self.blocks) - 1) * self.rows
+        data, ids = self.blocks[-1]
+        return self.blocks[:-1] + [(data[:last], ids[:last])]
+
+
+class BruteForceIndex:
+    """Полный перебор: одна матрица, одно умножение на запрос"""
+
+    def __init__(self, dim=DIM):
+        self.dim = dim
+        self._store = _Growable(dim)
+
+    def __len__(self):
+        return self._store.size
+
+    def add(self, vectors, ids):
+        self._store.extend(vectors, ids)
+
+    def search(self, query, k=1) -> list:
+        """[(косинус, id)] от самого похожего"""
+        return self._store.search(query, k)
+
+    def parts(self) -> list:
+        """[(векторы, id)] без копирования - для перестройки индекса"""
+        return [(self._store.data[:self._store.size], self._store.ids[:self._store.size])]
+
+
+def kmeans(vectors, nlist, iters=KMEANS_ITERS, seed=0):
+    """Сферический k-means: центры - нормированные средние своих векторов"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = (vectors @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]  # пустой кластер - новый случайный центр
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Инвертированные списки: векторы по кластерам k-means, поиск по NPROBE ближайшим"""
+
+    def __init__(self, centroids, nprobe=NPROBE):
+        self.centroids = centroids
+        self.dim = centroids.shape[1]
+        self.nprobe = nprobe
+        self._lists = [_Blocks(self.dim) for _ in range(len(centroids))]
+        self._size = 0
+        self.trained_size = 0  # сколько векторов было при обучении центров
+
+    @classmethod
+    def train(cls, parts, nlist=None, nprobe=NPROBE, sample=KMEANS_SAMPLE, seed=0):
+        """Центры по случайной выборке векторов из [(векторы, id)]; nlist по умолчанию ~ 2 sqrt(N).
+        Все векторы в один массив не склеиваем: при 1M это лишние 2 ГБ на время обучения"""
+        ends = np.cumsum([len(part) for part, _ in parts])
+        total = int(ends[-1])
+        nlist = nlist or max(16, int(2 * np.sqrt(total)))
+        rng = np.random.default_rng(seed)
+        picked = np.sort(rng.choice(total, min(sample, total), replace=False))
+        which = np.searchsorted(ends, picked, side="right")
+        sampled = np.concatenate([part[picked[which == i] - (ends[i] - len(part))]
+                                  for i, (part, _) in enumerate(parts) if (which == i).any()])
+        index = cls(kmeans(sampled, min(nlist, len(sampled)), seed=seed), nprobe)
+        index.trained_size = total
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def parts(self) -> list:
+        """[(векторы, id)] всех непустых списков без копирования - для переобучения"""
+        return [part for store in self._lists for part in store.parts()]
+
+    def add(self, vectors, ids, chunk=16384):
+        for start in range(0, len(vectors), chunk):
+            part, part_ids = vectors[start:start + chunk], ids[start:start + chunk]
+            assign = (part @ self.centroids.T).argmax(axis=1)
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+            for cluster in np.flatnonzero(np.diff(bounds)):
+                rows = order[bounds[cluster]:bounds[cluster + 1]]
+                self._lists[cluster].extend(part[rows], part_ids[rows])
+        self._size += len(vectors)
+
+    def search(self, query, k=1) -> list:
+        """[(косинус, id)] среди векторов nprobe ближайших кластеров"""
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        scores, ids = [], []
+        for cluster in probes:
+            for data, part_ids in self._lists[cluster].parts():
+                scores.append(data @ query)
+                ids.append(part_ids)
+        if not scores:
+            return []
+        return _top_k(np.concatenate(scores), np.concatenate(ids), k)
+
+
+class DupIndex:
+    """История отправленных фото: поиск похожих и запись новых на диск"""
+
+    def __init__(self, path=DUP_DIR, dim=DIM, threshold=DUP_THRESHOLD, ivf_threshold=IVF_THRESHOLD,
+                 persist=True):
+        self.path = path
+        self.dim = dim
+        self.threshold = threshold
+        self.ivf_threshold = ivf_threshold
+        self.persist = persist
+        self.meta = []
+        self.index = BruteForceIndex(dim)
+        self._lock = threading.Lock()
+        self._retrain_thread = None
+        self._pending = []  # (векторы, id), добавленные во время фонового переобучения
+        if persist:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    def __len__(self):
+        return len(self.meta)
+
+    def _load(self):
+        meta_path = os.path.join(self.path, "meta.jsonl")
+        vectors_path = os.path.join(self.path, "vectors.f16")
+        if not os.path.exists(meta_path) or not os.path.exists(vectors_path):
+            return
+        meta, ends = [], []  # ends[i] - конец i-й строки описания в байтах
+        offset = 0
+        with open(meta_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("строка не дописана")
+                    meta.append(json.loads(line))
+                except ValueError:
+                    break
+                offset += len(line)
+                ends.append(offset)
+        vectors = np.fromfile(vectors_path, dtype=np.float16)
+        count = min(len(meta), len(vectors) // self.dim)
+        # Недописанный хвост после сбоя отбрасываем в обоих файлах, иначе
+        # следующие записи встанут не в пару со своими описаниями
+        meta_size = ends[count - 1] if count else 0
+        if os.path.getsize(meta_path) != meta_size:
+            os.truncate(meta_path, meta_size)
+        if len(vectors) != count * self.dim:
+            os.truncate(vectors_path, count * self.dim * 2)  # float16 - 2 байта
+        self.meta = meta[:count]
+        if count:
+            self._index_vectors(vectors[:count * self.dim].reshape(count, self.dim).astype(np.float32),
+                                np.arange(count), background=False)
+
+    def _index_vectors(self, vectors, ids, background=True):
+        """Добавляет векторы в индекс (вызывается под self._lock)"""
+        self.index.add(vectors, ids)
+        if self._retrain_thread is not None:
+            # Попадут и в новый индекс; до тех пор храним их как на диске, в float16,
+            # иначе на время обучения в памяти лишняя копия всего прироста
+            self._pending.append((vectors.astype(np.float16), ids))
+            return
+        self._maybe_rebuild(background)
+
+    def _maybe_rebuild(self, background=True):
+        """Перестраивает индекс, если он вырос (вызывается под self._lock)"""
+        if isinstance(self.index, BruteForceIndex):
+            rebuild = len(self.index) >= self.ivf_threshold
+        else:
+            rebuild = len(self.index) >= self.index.trained_size * RETRAIN_GROWTH
+        if not rebuild:
+            return
+        # Снимок без копирования: уже записанные строки массивов не меняются
+        parts = self.index.parts()
+        nprobe = getattr(self.index, "nprobe", NPROBE)
+        if not background:
+            self.index = self._build(parts, nprobe)
+            return
+        self._retrain_thread = threading.Thread(target=self._retrain, args=(parts, nprobe),
+                                                name="dup-index-retrain", daemon=True)
+        self._retrain_thread.start()
+
+    @staticmethod
+    def _build(parts, nprobe):
+        """Новый IVF по векторам parts"""
+        index = IVFIndex.train(parts, nprobe=nprobe)
+        # Блоки снимка мелкие: добавляем пачками по ~16k строк, а не проходом по кластерам на каждый блок
+        group, rows = [], 0
+        for i, (vectors, ids) in enumerate(parts):
+            group.append((vectors, ids))
+            rows += len(vectors)
+            if rows >= 16384 or i == len(parts) - 1:
+                index.add(np.concatenate([v for v, _ in group]), np.concatenate([g for _, g in group]))
+                group, rows = [], 0
+        return index
+
+    def _retrain(self, parts, nprobe):
+        """Фоновый поток: строит индекс без блокировки, подменяет под блокировкой"""
+        try:
+            index = self._build(parts, nprobe)
+        except Exception as e:
+            print(f"Не удалось переобучить индекс дубликатов: {e}")
+            index = None
+        del parts
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                if index is None or not pending:
+                    self._retrain_thread = None
+                    if index is not None:
+                        self.index = index
+                        self._maybe_rebuild()  # пока учились, история могла вырасти ещё вдвое
+                    return
+            # Добавленное за время обучения переносим тоже без блокировки
+            for vectors, ids in pending:
+                index.add(vectors.astype(np.float32), ids)
+
+    def wait_retrain(self):
+        """Дожидается фонового переобучения (для бенчмарка и командной строки)"""
+        while True:
+            thread = self._retrain_thread
+            if thread is None:
+                return
+            thread.join()
+
+    def search(self, embedding, k=1) -> list:
+        """[(косинус, описание фото)] самых похожих из истории"""
+        query = _normalize(embedding)
+        with self._lock:
+            return [(score, self.meta[i]) for score, i in self.index.search(query, k)]
+
+    def add(self, embedding, meta):
+        """Запоминает фото; meta - словарь (кто, когда, хэш и т.п.)"""
+        return self.add_many([embedding], [meta])[0]
+
+    def add_many(self, embeddings, metas) -> list:
+        """Запоминает несколько фото одним вызовом; номера новых записей"""
+        vectors = _normalize(embeddings).reshape(-1, self.dim)
+        with self._lock:
+            first = len(self.meta)
+            self.meta.extend(metas)
+            self._index_vectors(vectors, np.arange(first, first + len(vectors)))
+            if self.persist:
+                # Сначала векторы, потом описания: см. _load
+                with open(os.path.join(self.path, "vectors.f16"), "ab") as f:
+                    f.write(vectors.astype(np.float16).tobytes())
+                with open(os.path.join(self.path, "meta.jsonl"), "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(meta, ensure_ascii=False) + "\n" for meta in metas)
+        return list(range(first, first + len(vectors)))
+
+    def submit(self, embedding, meta):
+        """Проверяет новое фото по истории и запоминает его: (косинус, описание) совпадения или None"""
+        found = self.search(embedding)
+        self.add(embedding, meta)
+        if found and found[0][0] >= self.threshold:
+            return found[0]
+        return None
+
+
+_dup_index = None
+_dup_index_lock = threading.Lock()
+
+
+def get_dup_index() -> DupIndex:
+    global _dup_index
+    with _dup_index_lock:
+        if _dup_index is None:
+            _dup_index = DupIndex()
+        return _dup_index
+
+
+def duplicate_note(classifier, file_path, user=None) -> str:
+    """Строка для экрана проверки еды, если похожее фото уже отправляли (и запись нового в историю)"""
+    if not hasattr(classifier, "embed_batch"):
+        return ""  # клиент food_server: эмбеддинги остаются на сервере
+    from result_cache import content_hash, read_source
+
+    data = read_source(file_path)
+    embedding = classifier.embed_batch([data])[0]
+    if embedding is None:
+        return ""
+    match = get_dup_index().submit(embedding, {"user": user, "hash": content_hash(data),
+                                               "name": os.path.basename(file_path), "time": time.time()})
+    if match is None:
+        return ""
+    score, meta = match
+    when = time.strftime("%d.%m.%Y", time.localtime(meta.get("time", 0)))
+    text = "Вы уже отправляли это фото" if user is not None and meta.get("user") == user else "Похожее фото уже отправляли"
+    return f"\n\n{text} {when} (сходство {score:.0%})"
+
+
+# === Бенчмарк и чистка архива ===
+
+def random_embeddings(n, dim=DIM, clusters=1000, spread=0.35, seed=0, chunk=100000):
+    """Нормированные векторы, собранные в группы (как эмбеддинги похожих фото), кусками по chunk"""
+    rng = np.random.default_rng(seed)
+    centers = _normalize(rng.standard_normal((clusters, dim), dtype=np.float32))
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        noise = rng.standard_normal((size, dim), dtype=np.float32) * (spread / np.sqrt(dim))
+        yield _normalize(centers[rng.integers(clusters, size=size)] + noise)
+
+
+def benchmark(n=1000000, queries=1000, k=1, nprobes=(NPROBE,), seed=0, chunk=10000):
+    """Задержка поиска и полнота DupIndex, выращенного с нуля до n векторов.
+    Полный перебор - тот же индекс с просмотром всех кластеров (лишней копии векторов не держим)"""
+    rng = np.random.default_rng(seed + 1)
+    targets = np.sort(rng.integers(n, size=queries))
+    probes = np.empty((queries, DIM), dtype=np.float32)
+
+    # Индекс растёт так же, как в приложении: добавлениями, с переобучением по ходу
+    dup = DupIndex(persist=False)
+    start = time.perf_counter()
+    slowest = slowest_search = 0.0
+    first = 0
+    for part in random_embeddings(n, seed=seed, chunk=chunk):
+        inside = (targets >= first) & (targets < first + len(part))
+        probes[inside] = part[targets[inside] - first]
+        t0 = time.perf_counter()
+        dup.add_many(part, [None] * len(part))
+        slowest = max(slowest, time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        dup.search(part[0])  # проверка дубликата, пока в фоне может идти переобучение
+        slowest_search = max(slowest_search, time.perf_counter() - t0)
+        first += len(part)
+    t0 = time.perf_counter()
+    dup.wait_retrain()
+    index = dup.index
+    print(f"DupIndex: {n} x {DIM}, выращен за {time.perf_counter() - start:.1f} с "
+          f"(ожидание последнего переобучения {time.perf_counter() - t0:.1f} с)")
+    print(f"  по ходу роста: самое долгое добавление {chunk} векторов {slowest * 1000:.0f} мс, "
+          f"самый долгий поиск {slowest_search * 1000:.1f} мс")
+    if not isinstance(index, IVFIndex):
+        print("  меньше IVF_THRESHOLD векторов: индекс - полный перебор")
+        nprobes = ()
+    else:
+        print(f"  IVF: {len(index.centroids)} кластеров, обучен на {index.trained_size} векторах, "
+              f"в кластере в среднем {len(index) // len(index.centroids)}")
+
+    # Запросы - слегка искажённые копии сохранённых векторов (почти дубликаты)
+    probes = _normalize(probes + rng.standard_normal((queries, DIM), dtype=np.float32) * 0.01)
+    full = len(index.centroids) if isinstance(index, IVFIndex) else None
+    for name, nprobe in [("перебор", full)] + [(f"nprobe={nprobe}", nprobe) for nprobe in nprobes]:
+        if nprobe is not None:
+            index.nprobe = nprobe
+        times, hits = [], 0
+        for probe, target in zip(probes, targets):
+            t0 = time.perf_counter()
+            found = index.search(probe, k)
+            times.append(time.perf_counter() - t0)
+            hits += bool(found) and found[0][1] == target
+        times.sort()
+        print(f"  {name:<12} p50 {times[len(times) // 2] * 1000:.3f} мс, "
+              f"p99 {times[int(len(times) * 0.99)] * 1000:.3f} мс, находит исходник: {hits / queries:.1%}")
+
+
+def _embed_chunk(classifier, paths) -> list:
+    """[(путь, эмбеддинг, ошибка)]: битое фото не обрывает обработку остальных"""
+    try:
+        embeddings = classifier.embed_batch(paths)
+    except Exception as e:
+        if len(paths) == 1:
+            return [(paths[0], None, str(e))]
+        return [result for path in paths for result in _embed_chunk(classifier, [path])]
+    return [(path, embedding, None if embedding is not None else "нет эмбеддинга")
+            for path, embedding in zip(paths, embeddings)]
+
+
+def dedupe(directory, threshold=DUP_THRESHOLD, out_path="-", batch_size=32):
+    """Группы почти одинаковых фото в архиве: первое в группе оставляем, остальные - дубликаты"""
+    from batch_classify import iter_directory
+    from food_classifier import FoodClassifier
+
+    classifier = FoodClassifier()
+    index = DupIndex(threshold=threshold, persist=False)
+    groups = {}  # номер первого фото группы -> [(путь, сходство)]
+    errors = []
+    paths = list(iter_directory(directory))
+    start = time.perf_counter()
+    for chunk_start in range(0, len(paths), batch_size):
+        chunk = paths[chunk_start:chunk_start + batch_size]
+        for path, embedding, error in _embed_chunk(classifier, chunk):
+            if error is not None:
+                errors.append({"path": path, "error": error})
+                continue
+            found = index.search(embedding)
+            match = found[0] if found and found[0][0] >= threshold else None
+            group = match[1]["group"] if match else len(index)
+            index.add(embedding, {"path": path, "group": group})
+            groups.setdefault(group, []).append((path, round(match[0], 4) if match else 1.0))
+
+    duplicates = 0
+    out = open(out_path, "w", encoding="utf-8") if out_path != "-" else None
+    try:
+        for members in groups.values():
+            if len(members) > 1:
+                duplicates += len(members) - 1
+                line = json.dumps({"keep": members[0][0], "duplicates": members[1:]}, ensure_ascii=False)
+                print(line, file=out)
+        for error in errors:
+            print(json.dumps(error, ensure_ascii=False), file=out)
+    finally:
+        if out:
+            out.close()
+    print(f"Фото: {len(paths)}, дубликатов: {duplicates}, групп: "
+          f"{sum(len(m) > 1 for m in groups.values())}, не прочитано: {len(errors)} "
+          f"за {time.perf_counter() - start:.1f} с")
+
+
+def check_torn_write() -> bool:
+    """Самопроверка: обрыв между записью вектора и описания не путает пары после перезапуска"""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    vectors = _normalize(rng.standard_normal((4, DIM), dtype=np.float32))
+    with tempfile.TemporaryDirectory() as tmp:
+        index = DupIndex(tmp)
+        index.add_many(vectors[:2], [{"user": "a"}, {"user": "b"}])
+        # Сбой после записи вектора, но до описания: лишний вектор и полстроки описания
+        with open(os.path.join(tmp, "vectors.f16"), "ab") as f:
+            f.write(vectors[2].astype(np.float16).tobytes())
+        with open(os.path.join(tmp, "meta.jsonl"), "a", encoding="utf-8") as f:
+            f.write('{"user": "c"')
+        index = DupIndex(tmp)
+        index.add(vectors[3], {"user": "d"})
+        index = DupIndex(tmp)  # и после ещё одного перезапуска
+        score, meta = index.search(vectors[3])[0]
+        orphan_score, _ = index.search(vectors[2])[0]
+        ok = (len(index) == 3 and meta == {"user": "d"} and score > 0.99 and orphan_score < 0.5
+              and os.path.getsize(os.path.join(tmp, "vectors.f16")) == 3 * DIM * 2)
+    print(f"Обрыв записи: {'ок' if ok else 'ОШИБКА'} (своя запись {score:.3f}, потерянный вектор {orphan_score:.3f})")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Индекс эмбеддингов: поиск повторно отправленных фото")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="задержка поиска: перебор против DupIndex")
+    bench.add_argument("--vectors", type=int, default=1000000)
+    bench.add_argument("--queries", type=int, default=1000)
+    bench.add_argument("--nprobe", type=int, nargs="+", default=[2, NPROBE, 8])
+    sub.add_parser("check", help="самопроверка восстановления после оборванной записи")
+    dd = sub.add_parser("dedupe", help="найти почти одинаковые фото в папке")
+    dd.add_argument("directory")
+    dd.add_argument("--threshold", type=float, default=DUP_THRESHOLD)
+    dd.add_argument("--out", default="-", help="группы дубликатов в JSONL (- для вывода на экран)")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.vectors, args.queries, nprobes=args.nprobe)
+    elif args.command == "check":
+        raise SystemExit(0 if check_torn_write() else 1)
+    else:
+        dedupe(args.directory, args.threshold, args.out)
@@ -0,0 +1,212 @@
+import io
+import os
+import sys
+import time
+import json
+import argparse
+import subprocess
+
+try:
+    import resource  # пиковая память процесса; на Windows модуля нет
+except ImportError:
+    resource = None
+
+# === Быстрое декодирование фото для CLIP ===
+# Фото с телефона - 12+ Мп, а модели нужен квадрат 224x224. JPEG умеет
+# декодироваться сразу в 1/2, 1/4 или 1/8 размера (draft), так что полный
+# кадр в память не попадает. Дальше поворот по EXIF, уменьшение короткой
+# стороны до 224 (bicubic, как в preprocess CLIP), центральный квадрат и
+# нормировка. Результат совпадает с preprocess с точностью до
+# масштабирования при декодировании.
+INPUT_SIZE = 224
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+SOURCE_EXTS = (".jpg", ".jpeg")
+VIEW_NAMES = ("center", "start", "end", "whole", "center_flip", "whole_flip")  # см. decode_views
+
+
+class DecodeError(ValueError):
+    """Файл не удалось прочитать как картинку (не фото, обрезан, повреждён)"""
+
+
+def _open(source):
+    from PIL import Image as PILImage
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return PILImage.open(source)
+
+
+def _scaled(source, size, draft=True):
+    """RGB с короткой стороной size"""
+    try:
+        return _scaled_image(source, size, draft)
+    except (OSError, SyntaxError, ValueError) as e:  # так PIL сообщает о битых и чужих файлах
+        if isinstance(source, str) and not os.path.exists(source):
+            raise
+        raise DecodeError(f"не удалось прочитать фото: {e}") from e
+
+
+def _scaled_image(source, size, draft):
+    from PIL import Image as PILImage, ImageOps
+
+    image = _open(source)
+    if draft:
+        # Наименьший масштаб JPEG, при котором обе стороны не меньше size
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+    image = image.convert("RGB")
+
+    w, h = image.size
+    scale = size / min(w, h)
+    new_w, new_h = max(size, round(w * scale)), max(size, round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = image.resize((new_w, new_h), PILImage.BICUBIC)
+    return image
+
+
+def _center(image, size):
+    left, top = (image.width - size) // 2, (image.height - size) // 2
+    return image.crop((left, top, left + size, top + size))
+
+
+def decode(source, size=INPUT_SIZE, draft=True):
+    """Картинка size x size в RGB из пути, байтов или файла; draft=False - как раньше, полный декод"""
+    return _center(_scaled(source, size, draft), size)
+
+
+def decode_views(source, size=INPUT_SIZE) -> list:
+    """Несколько видов для спорных фото: центр, оба края длинной стороны, всё фото и отражения"""
+    from PIL import Image as PILImage
+
+    image = _scaled(source, size)
+    w, h = image.size
+    center = _center(image, size)
+    whole = image.resize((size, size), PILImage.BICUBIC)  # края, которые центр обрезает
+    return [
+        center,
+        image.crop((0, 0, size, size)),
+        image.crop((w - size, h - size, w, h)),
+        whole,
+        center.transpose(PILImage.FLIP_LEFT_RIGHT),
+        whole.transpose(PILImage.FLIP_LEFT_RIGHT),
+    ]
+
+
+def to_tensor(image):
+    """Тензор 3 x H x W с нормировкой CLIP"""
+    import torch
+
+    w, h = image.size
+    tensor = torch.frombuffer(bytearray(image.tobytes()), dtype=torch.uint8).view(h, w, 3)
+    tensor = tensor.permute(2, 0, 1).float().div_(255)
+    mean = torch.tensor(CLIP_MEAN).view(3, 1, 1)
+    std = torch.tensor(CLIP_STD).view(3, 1, 1)
+    return tensor.sub_(mean).div_(std)
+
+
+def load_tensor(source, size=INPUT_SIZE):
+    """Готовый для модели тензор 3 x size x size (без размерности батча)"""
+    return to_tensor(decode(source, size))
+
+
+def load_views(source, size=INPUT_SIZE):
+    """Тензор V x 3 x size x size из decode_views"""
+    import torch
+
+    return torch.stack([to_tensor(view) for view in decode_views(source, size)])
+
+
+def input_size(model) -> int:
+    """Размер входа модели CLIP (224 у ViT-B/32, 336 у ViT-L/14@336px)"""
+    visual = getattr(model, "visual", None)
+    return getattr(visual, "input_resolution", INPUT_SIZE)
+
+
+# === Бенчмарк ===
+# Каждый способ запускается в отдельном процессе: ru_maxrss - пик за всю
+# жизнь процесса, и в одном процессе второй замер видел бы первый.
+
+def _sources(directory):
+    with os.scandir(directory) as entries:
+        return sorted(entry.path for entry in entries
+                      if entry.is_file() and entry.name.lower().endswith(SOURCE_EXTS))
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # macOS - байты, Linux - КБ
+
+
+def _measure(mode, paths, size):
+    """Выполняется в дочернем процессе: время на фото и пиковая память"""
+    from PIL import Image as PILImage  # noqa: F401 - импорт не входит в замер
+
+    times = []
+    for path in paths:
+        start = time.perf_counter()
+        if mode != "idle":
+            decode(path, size, draft=(mode == "draft"))
+        times.append(time.perf_counter() - start)
+    return {"times": times, "peak_rss": _peak_rss_mb()}
+
+
+def _run_child(mode, paths, size):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--size", str(size), *paths],
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def make_corpus(directory, count=20, width=4032, height=3024, seed=0):
+    """Набор крупных JPEG (как с камеры телефона) для бенчмарка"""
+    import random
+    from PIL import Image as PILImage, ImageDraw
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    for i in range(count):
+        image = PILImage.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(200):
+            x, y = rng.randrange(width), rng.randrange(height)
+            r = rng.randrange(20, 400)
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+        image.save(os.path.join(directory, f"photo_{i:03d}.jpg"), quality=90)
+
+
+def benchmark(directory, size=INPUT_SIZE):
+    """Время декодирования и пиковая память: полный декод против draft"""
+    paths = _sources(directory)
+    if not paths:
+        print(f"В {directory} нет JPEG")
+        return
+    print(f"фото: {len(paths)}, размер входа: {size}")
+    idle = _run_child("idle", paths, size)
+    print(f"{'способ':<16} {'среднее, мс':>12} {'p95, мс':>9} {'пик RSS, МБ':>12} {'сверх пустого, МБ':>18}")
+    for mode, name in (("full", "полный декод"), ("draft", "draft + EXIF")):
+        result = _run_child(mode, paths, size)
+        times = sorted(result["times"])
+        rss = result["peak_rss"]
+        rss_text = f"{rss:>12.0f} {rss - idle['peak_rss']:>18.0f}" if rss is not None else f"{'-':>12} {'-':>18}"
+        print(f"{name:<16} {sum(times) / len(times) * 1000:>12.1f} "
+              f"{times[int(len(times) * 0.95)] * 1000:>9.1f} {rss_text}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк декодирования фото для CLIP")
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--dir", default="bench_photos", help="папка с JPEG")
+    parser.add_argument("--make", type=int, default=0, help="сначала создать столько тестовых фото 12 Мп")
+    parser.add_argument("--size", type=int, default=INPUT_SIZE)
+    parser.add_argument("--child", choices=("idle", "full", "draft"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_measure(args.child, args.paths, args.size)))
+    else:
+        if args.make:
+            make_corpus(args.dir, args.make)
+        benchmark(args.dir, args.size)
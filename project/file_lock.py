@@ -0,0 +1,35 @@
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# === Блокировка файла между процессами ===
+# Общие журналы (points_ledger.py, chat_store.py) могут открыть несколько
+# приложений сразу. Запись идёт под блокировкой отдельного файла <журнал>.lock.
+
+
+@contextmanager
+def locked_file(f):
+    """Монопольная блокировка открытого файла между процессами"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # сам ждёт ~10 с, потом OSError
+            break
+        except OSError:
+            pass
+    try:
+        yield
+    finally:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,384 @@
+import os
+import json
+import math
+import time
+import argparse
+import threading
+from collections import namedtuple
+
+from clip_model import MODEL_NAME, get_provider
+
+# === Общий движок проверки еды ===
+# Один класс на все интерфейсы (prog.py, progauth.py, reg.py, test, tk.py)
+# и пакетную проверку. Подсказки CLIP и вердикты задаются таблицей. Модель
+# общая на процесс (clip_model.get_provider), эмбеддинги подсказок
+# кэшируются (text_cache.py), результаты по фото тоже (result_cache.py).
+# Любое ускорение здесь сразу получают все интерфейсы.
+# Если задан FOOD_SERVER=host:port, модель в процессе не грузится: проверки
+# уходят на общий сервер (food_server.py).
+SERVER_ADDRESS = os.environ.get("FOOD_SERVER")
+# Спорные фото (лучший вердикт опережает другой меньше чем на TTA_MARGIN по
+# сходству) перепроверяются по нескольким видам: центр, края, всё фото,
+# отражения (fast_decode.decode_views). Таких фото немного, поэтому средняя
+# задержка почти как у одного вида. 0 - не перепроверять.
+TTA_MARGIN = float(os.environ.get("FOOD_TTA_MARGIN", "0.005"))
+# Вероятности вердиктов: softmax(LOGIT_SCALE * сходство / T) по подсказкам,
+# сложенный по синонимам одного вердикта. Сам вердикт по-прежнему даёт лучшая
+# подсказка (как в backends.parity), вероятности только добавляются к ответу.
+# Температуру T подбирает `python food_classifier.py calibrate photos/`
+# на размеченных фото.
+LOGIT_SCALE = 100.0  # как у CLIP (exp(logit_scale) обученной модели)
+CALIBRATION_FILE = "food_calibration.json"
+
+# Подсказка CLIP -> вердикт
+DEFAULT_LABELS = (
+    ("not food", "not_food"),
+    ("fresh food", "edible"),
+    ("edible food", "edible"),
+    ("tasty food", "edible"),
+    ("rotten food", "not_edible"),
+    ("food with mold", "not_edible"),
+)
+VERDICT_TEXT = {
+    "edible": "Эту еду можно есть!",
+    "not_edible": "Эту еду есть нельзя!",
+    "not_food": "Это не еда!",
+}
+
+
+class Prediction(namedtuple("Prediction", "label verdict score scores margin views probs",
+                            defaults=(None, 1, None))):
+    """Ответ классификатора: подсказка-победитель, вердикт, её сходство, все сходства,
+    отрыв от лучшего другого вердикта, число видов фото и вероятности вердиктов"""
+    __slots__ = ()
+
+    @property
+    def text(self) -> str:
+        return VERDICT_TEXT.get(self.verdict, self.verdict)
+
+    @property
+    def confidence(self):
+        """Калиброванная вероятность выбранного вердикта"""
+        return self.probs.get(self.verdict) if self.probs else None
+
+    def describe(self, texts=None) -> str:
+        """Текст для экрана проверки еды; texts - свои тексты вердиктов вместо VERDICT_TEXT"""
+        views = f" (по {self.views} видам фото)" if self.views > 1 else ""
+        confidence = f"\nУверенность: {self.confidence:.0%}" if self.confidence is not None else ""
+        text = texts.get(self.verdict, self.text) if texts else self.text
+        return f"CLIP считает: {self.label}{views}\n\n{text}{confidence}"
+
+
+def calibration_key(model_name, prompts) -> str:
+    from result_cache import prompts_hash
+
+    return f"{model_name}|{prompts_hash(prompts)}"
+
+
+def load_temperature(model_name, prompts, path=CALIBRATION_FILE) -> float:
+    """Подобранная температура для модели и набора подсказок (1.0, если калибровки нет)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f).get(calibration_key(model_name, prompts))
+    except (OSError, ValueError):
+        entry = None
+    return entry["temperature"] if entry else 1.0
+
+
+class FoodClassifier:
+    """Проверка фото еды через CLIP по таблице (подсказка, вердикт)"""
+
+    def __init__(self, labels=DEFAULT_LABELS, provider=None, backend=None, cache=None, tta_margin=TTA_MARGIN):
+        self.labels = tuple(labels)
+        self.prompts = [prompt for prompt, _ in self.labels]
+        self.verdicts = [verdict for _, verdict in self.labels]
+        self.provider = provider or get_provider(MODEL_NAME)
+        self.backend = backend  # None - из CLIP_BACKEND, см. backends.py
+        self.cache = cache
+        self.tta_margin = tta_margin
+        self._temperature = None
+
+    def start(self, callback=None):
+        """Начать загрузку модели в фоне (см. ModelProvider.start)"""
+        self.provider.start(callback)
+
+    def text_features(self):
+        """Нормированные эмбеддинги подсказок (считаются один раз)"""
+        from text_cache import get_text_features
+
+        model, _, device = self.provider.get()
+        return get_text_features(model, self.prompts, self.provider.model_name, device)
+
+    @property
+    def temperature(self) -> float:
+        if self._temperature is None:
+            self._temperature = load_temperature(self.provider.model_name, self.prompts)
+        return self._temperature
+
+    @temperature.setter
+    def temperature(self, value):
+        self._temperature = value
+
+    def verdict_probs(self, scores, temperature=None) -> dict:
+        """{вердикт: вероятность}: softmax по подсказкам, сложенный по синонимам"""
+        scale = LOGIT_SCALE / (temperature or self.temperature)
+        top = max(scores)
+        weights = [math.exp((s - top) * scale) for s in scores]
+        total = sum(weights)
+        probs = {}
+        for weight, verdict in zip(weights, self.verdicts):
+            probs[verdict] = probs.get(verdict, 0.0) + weight / total
+        return probs
+
+    def predict(self, similarity, views=1) -> Prediction:
+        """Вердикт по вектору сходства с подсказками"""
+        scores = similarity.tolist()
+        best = max(range(len(scores)), key=scores.__getitem__)
+        verdict = self.verdicts[best]
+        others = [s for s, v in zip(scores, self.verdicts) if v != verdict]
+        margin = scores[best] - max(others) if others else None
+        return Prediction(self.prompts[best], verdict, scores[best], scores, margin, views, self.verdict_probs(scores))
+
+    def classify(self, image) -> Prediction:
+        """Одно фото: путь, байты или готовый тензор 3 x H x W"""
+        return self.classify_batch([image])[0]
+
+    def classify_batch(self, images) -> list:
+        """Несколько фото одной пачкой; пути и байты идут через кэш результатов"""
+        import torch
+        from result_cache import cached_scores_batch
+
+        if not images:
+            return []
+        if torch.is_tensor(images[0]):
+            from backends import get_encoder
+
+            text_features = self.text_features()
+            features = get_encoder(self.provider, self.backend).encode(torch.stack(list(images)))
+            similarity = (features.to(text_features.device, text_features.dtype) @ text_features.T).float().cpu()
+            return [self.predict(row) for row in similarity]
+        scores = cached_scores_batch(images, self.prompts, self.provider, self.cache, self.backend)
+        return self.refine(images, [self.predict(row) for row in scores])
+
+    def embed_batch(self, sources) -> list:
+        """Нормированные эмбеддинги фото (пути или байты): из кэша результатов, недостающие - через модель"""
+        from backends import model_id
+        from result_cache import cached_scores_batch, content_hash, get_cache, read_source
+
+        cache = self.cache or get_cache()
+        key = model_id(self.provider.model_name, self.backend)
+        data = [read_source(source) for source in sources]
+        hashes = [content_hash(item) for item in data]
+        embeddings = [cache.get_embedding(image_hash, key) for image_hash in hashes]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            cached_scores_batch([data[i] for i in missing], self.prompts, self.provider, cache, self.backend)
+            key = model_id(self.provider.model_name, self.backend)  # бэкенд мог откатиться на torch
+            for i in missing:
+                embeddings[i] = cache.get_embedding(hashes[i], key)
+        return embeddings
+
+    def borderline(self, prediction) -> bool:
+        return (self.tta_margin > 0 and prediction.margin is not None
+                and prediction.margin < self.tta_margin)
+
+    def refine(self, sources, predictions) -> list:
+        """Перепроверяет спорные ответы по нескольким видам фото (sources - пути или байты)"""
+        todo = [i for i, prediction in enumerate(predictions) if self.borderline(prediction)]
+        if not todo:
+            return predictions
+        predictions = list(predictions)
+        views = self.multi_view_scores([sources[i] for i in todo])
+        for i, (scores, count) in zip(todo, views):
+            predictions[i] = self.predict(scores, count)
+        return predictions
+
+    def multi_view_scores(self, sources) -> list:
+        """[(сходства, число видов)] по усреднённым эмбеддингам видов; кэшируются отдельно"""
+        import torch
+        from backends import get_encoder, model_id
+        from fast_decode import VIEW_NAMES, input_size, load_views
+        from result_cache import content_hash, get_cache, read_source
+
+        cache = self.cache or get_cache()
+        tta_id = model_id(self.provider.model_name, self.backend) + "+tta"
+        results = [None] * len(sources)
+        todo = []
+        for i, source in enumerate(sources):
+            data = read_source(source)
+            image_hash = content_hash(data)
+            scores = cache.get_scores(image_hash, tta_id, self.prompts)
+            if scores is not None:
+                results[i] = (torch.tensor(scores), len(VIEW_NAMES))
+            else:
+                todo.append((i, image_hash, data))
+        if todo:
+            model, _, device = self.provider.get()
+            text_features = self.text_features()
+            size = input_size(model)
+            batch = torch.stack([load_views(data, size) for _, _, data in todo])  # N x V x 3 x S x S
+            n, count = batch.shape[:2]
+            encoder = get_encoder(self.provider, self.backend)
+            features = encoder.encode(batch.flatten(0, 1))
+            tta_id = model_id(self.provider.model_name, self.backend, encoder) + "+tta"
+            features = features.to(device, text_features.dtype).view(n, count, -1).mean(dim=1)
+            # Среднее эмбеддингов даёт те же сходства, что среднее по видам, с точностью до общего множителя
+            features = features / features.norm(dim=-1, keepdim=True)
+            similarity = (features @ text_features.T).float().cpu()
+            for (i, image_hash, _), embedding, row in zip(todo, features, similarity):
+                cache.put(image_hash, tta_id, embedding.float().cpu().tolist(), self.prompts, row.tolist())
+                results[i] = (row, count)
+        return results
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_classifier(labels=DEFAULT_LABELS, model_name=MODEL_NAME, device=None) -> FoodClassifier:
+    """Один общий классификатор на (таблицу, модель, устройство) в пределах процесса.
+
+    С FOOD_SERVER вместо него возвращается клиент сервера (таблица - серверная).
+    """
+    with _classifiers_lock:
+        key = ("server", SERVER_ADDRESS) if SERVER_ADDRESS else (tuple(labels), model_name, device)
+        if key not in _classifiers:
+            if SERVER_ADDRESS:
+                from food_server import FoodClient
+
+                _classifiers[key] = FoodClient(SERVER_ADDRESS)
+            else:
+                _classifiers[key] = FoodClassifier(labels, get_provider(model_name, device))
+        return _classifiers[key]
+
+
+def benchmark(directory, margin=TTA_MARGIN):
+    """Задержка и точность: один вид, перепроверка спорных и все фото по нескольким видам"""
+    import tempfile
+    from backends import labeled_samples
+    from batch_classify import iter_directory
+    from result_cache import ResultCache
+
+    samples = labeled_samples(directory) or [(path, None) for path in iter_directory(directory)]
+    if not samples:
+        print(f"В {directory} нет фото")
+        return
+    provider = get_provider(MODEL_NAME)
+    provider.get()
+
+    print(f"фото: {len(samples)}, порог перепроверки: {margin}")
+    print(f"{'режим':<22} {'среднее, мс':>12} {'p95, мс':>9} {'перепроверено':>14} {'точность':>9}")
+    for name, mode_margin in (("один вид", 0.0), ("спорные по видам", margin), ("все по видам", float("inf"))):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(os.path.join(tmp, "bench.db"))  # пустой кэш: считаем модель, а не попадания
+            classifier = FoodClassifier(provider=provider, cache=cache, tta_margin=mode_margin)
+            times, escalated, correct = [], 0, 0
+            for path, label in samples:
+                start = time.perf_counter()
+                prediction = classifier.classify(path)
+                times.append(time.perf_counter() - start)
+                escalated += prediction.views > 1
+                correct += prediction.verdict == label
+            cache.close()
+        times.sort()
+        accuracy = f"{correct / len(samples):>9.1%}" if samples[0][1] is not None else f"{'-':>9}"
+        print(f"{name:<22} {sum(times) / len(times) * 1000:>12.1f} {times[int(len(times) * 0.95)] * 1000:>9.1f} "
+              f"{escalated / len(samples):>14.1%} {accuracy}")
+
+
+# === Калибровка температуры ===
+
+def _calibration_stats(classifier, scores, labels, temperature, bins=10):
+    """(log loss, ECE, точность) вердиктов при температуре temperature"""
+    nll, correct = 0.0, 0
+    buckets = [[0, 0.0, 0] for _ in range(bins)]  # [фото, сумма уверенности, верных]
+    for row, label in zip(scores, labels):
+        probs = classifier.verdict_probs(row, temperature)
+        verdict = classifier.verdicts[max(range(len(row)), key=row.__getitem__)]  # как в predict
+        nll -= math.log(max(probs.get(label, 0.0), 1e-12))
+        bucket = buckets[min(bins - 1, int(probs[verdict] * bins))]
+        bucket[0] += 1
+        bucket[1] += probs[verdict]
+        bucket[2] += verdict == label
+        correct += verdict == label
+    ece = sum(abs(confidence - hits) for _, confidence, hits in buckets) / len(labels)
+    return nll / len(labels), ece, correct / len(labels)
+
+
+def fit_temperature(classifier, scores, labels, low=0.05, high=20.0, steps=50) -> float:
+    """Температура с наименьшим log loss вердиктов (золотое сечение по log T)"""
+    def loss(log_t):
+        return _calibration_stats(classifier, scores, labels, math.exp(log_t))[0]
+
+    ratio = (math.sqrt(5) - 1) / 2
+    a, b = math.log(low), math.log(high)
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    fc, fd = loss(c), loss(d)
+    for _ in range(steps):
+        if fc < fd:
+            b, d, fd = d, c, fc
+            c = b - ratio * (b - a)
+            fc = loss(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a + ratio * (b - a)
+            fd = loss(d)
+    return math.exp((a + b) / 2)
+
+
+def calibrate(directory, path=CALIBRATION_FILE, batch_size=32):
+    """Подбирает температуру на размеченных фото и сохраняет её в path"""
+    from backends import labeled_samples
+
+    samples = labeled_samples(directory)
+    if not samples:
+        print(f"В {directory} нет размеченных фото (подпапки edible / not_edible / not_food)")
+        return None
+    classifier = FoodClassifier(tta_margin=0)
+    paths = [p for p, _ in samples]
+    labels = [label for _, label in samples]
+    scores = []
+    for start in range(0, len(paths), batch_size):
+        scores.extend(p.scores for p in classifier.classify_batch(paths[start:start + batch_size]))
+
+    before = _calibration_stats(classifier, scores, labels, 1.0)
+    temperature = fit_temperature(classifier, scores, labels)
+    after = _calibration_stats(classifier, scores, labels, temperature)
+
+    print(f"фото: {len(samples)}")
+    print(f"{'':<12} {'T':>6} {'log loss':>9} {'ECE':>7} {'точность':>9}")
+    for name, t, (nll, ece, accuracy) in (("без калибровки", 1.0, before), ("с калибровкой", temperature, after)):
+        print(f"{name:<12} {t:>6.3f} {nll:>9.4f} {ece:>7.3f} {accuracy:>9.1%}")
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[calibration_key(classifier.provider.model_name, classifier.prompts)] = {
+        "temperature": round(temperature, 5), "samples": len(samples),
+        "log_loss": round(after[0], 5), "ece": round(after[1], 5), "fitted_at": time.time(),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    print(f"Температура сохранена в {path}")
+    return temperature
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка еды: бенчмарк перепроверки и калибровка уверенности")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="перепроверка спорных фото по нескольким видам")
+    bench.add_argument("directory", help="папка с фото (подпапки edible / not_edible / not_food - с точностью)")
+    bench.add_argument("--margin", type=float, default=TTA_MARGIN)
+    cal = sub.add_parser("calibrate", help="подобрать температуру на размеченных фото")
+    cal.add_argument("directory", help="папка с подпапками edible / not_edible / not_food")
+    cal.add_argument("--out", default=CALIBRATION_FILE)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.directory, args.margin)
+    else:
+        calibrate(args.directory, args.out)
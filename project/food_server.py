@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import queue
+import random
+import argparse
+import tempfile
+import threading
+import http.client
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fast_decode import DecodeError
+from food_classifier import FoodClassifier, Prediction
+
+# === Сервер проверки еды ===
+# Одна модель CLIP на машину вместо своей копии в каждом окне-киоске.
+# HTTP поверх стандартной библиотеки:
+#   POST /classify  (тело - байты фото)  -> {"label", "verdict", "score", "scores"}
+#   GET  /health                          -> {"state": "warming" / "ready" / "error", ...}
+# Ошибки: 400 - тело не читается как фото, 503 - модель ещё грузится, не
+# загрузилась или сервер не успел ответить (можно повторить), 500 - прочие.
+# Одновременные запросы копятся в пачку, пока не пройдёт окно WINDOW или не
+# наберётся MAX_BATCH фото, и кодируются одним проходом модели
+# (FoodClassifier.classify_batch).
+# Интерфейсы переходят в режим клиента, если задана переменная окружения
+# FOOD_SERVER=host:port (см. food_classifier.get_classifier).
+HOST = "127.0.0.1"
+PORT = 8766
+WINDOW = 0.01          # секунды ожидания соседей по пачке
+MAX_BATCH = 32
+MAX_UPLOAD = 20 * 1024 * 1024
+REQUEST_TIMEOUT = 60.0
+WARMUP_TIMEOUT = 300.0  # сколько клиент ждёт, пока сервер загрузит модель
+
+
+class MicroBatcher:
+    """Собирает одновременные запросы в пачки и отдаёт их process(items) -> results"""
+
+    def __init__(self, process, window=WINDOW, max_batch=MAX_BATCH):
+        self.process = process
+        self.window = window
+        self.max_batch = max_batch
+        self.stats = {"requests": 0, "batches": 0, "failed": 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="food-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    # Окно вышло - забираем только то, что уже в очереди
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        items = [item for item, _ in batch]
+        self.stats["requests"] += len(items)
+        self.stats["batches"] += 1
+        try:
+            results = [(result, None) for result in self.process(items)]
+        except Exception as e:
+            # Одно битое фото не должно ронять соседей по пачке
+            results = [self._one(item) for item in items] if len(items) > 1 else [(None, e)]
+        for (_, future), (result, error) in zip(batch, results):
+            if error is not None:
+                self.stats["failed"] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _one(self, item):
+        try:
+            return self.process([item])[0], None
+        except Exception as e:
+            return None, e
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FoodServer/1.0"
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._reply(404, {"error": "not found"})
+            return
+        provider = self.server.classifier.provider
+        batcher = self.server.batcher
+        self._reply(200, {"state": provider.state, "metrics": provider.metrics, "batches": batcher.stats,
+                          "window": batcher.window, "max_batch": batcher.max_batch})
+
+    def do_POST(self):
+        if self.path != "/classify":
+            self._reply(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if not 0 < length <= MAX_UPLOAD:
+            self._reply(413 if length else 400, {"error": "нужно фото до 20 МБ"})
+            return
+        data = self.rfile.read(length)
+        state = self.server.classifier.provider.state
+        if state != "ready":
+            self.server.classifier.start()  # запросы не должны ждать в очереди, пока грузится модель
+            self._reply(503, {"error": f"модель: {state}", "state": state}, retry_after=5)
+            return
+        try:
+            prediction = self.server.batcher.submit(data).result(REQUEST_TIMEOUT)
+        except DecodeError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        except FutureTimeout:
+            self._reply(503, {"error": "сервер перегружен, повторите позже"}, retry_after=1)
+            return
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        self._reply(200, prediction._asdict())
+
+    def _reply(self, status, payload, retry_after=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # по строке на запрос - слишком шумно
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # по умолчанию 5: при всплеске клиенты получали бы отказ в соединении
+
+
+class FoodServer:
+    """HTTP-сервер с одной моделью и пакетной обработкой запросов"""
+
+    def __init__(self, classifier=None, host=HOST, port=PORT, window=WINDOW, max_batch=MAX_BATCH):
+        self.classifier = classifier or FoodClassifier()
+        self.httpd = _HTTPServer((host, port), _Handler)
+        self.httpd.classifier = self.classifier
+        self.httpd.batcher = self.batcher = MicroBatcher(self.classifier.classify_batch, window, max_batch)
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        """Начинает загрузку модели и принимает запросы в фоновом потоке"""
+        self.classifier.start()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="food-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Как start(), но в текущем потоке (для запуска из командной строки)"""
+        self.classifier.start()
+        self.httpd.serve_forever()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.batcher.close()
+
+
+def _request(address, method, path, body=None, timeout=REQUEST_TIMEOUT):
+    host, port = address.rsplit(":", 1)
+    conn = http.client.HTTPConnection(host, int(port), timeout=timeout)
+    try:
+        conn.request(method, path, body=body)
+        response = conn.getresponse()
+        payload = json.loads(response.read().decode("utf-8"))
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(payload.get("error", f"HTTP {response.status}"))
+    return payload
+
+
+class RemoteProvider:
+    """Замена ModelProvider в режиме клиента: "загрузка" - ожидание готовности сервера"""
+
+    def __init__(self, address, poll_seconds=1.0):
+        self.address = address
+        self.model_name = f"server {address}"
+        self.poll_seconds = poll_seconds
+        self.error = None
+        self.metrics = {"state": "idle"}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._callbacks = []
+
+    @property
+    def state(self) -> str:
+        return self.metrics["state"]
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.error is None
+
+    def start(self, callback=None):
+        """Ждёт сервер в фоне; после ошибки ("unreachable", "error") повторный вызов ждёт заново"""
+        with self._lock:
+            if self.error is not None and self._ready.is_set():
+                # Киоск мог запуститься раньше сервера: не требуем перезапуска
+                self.error = None
+                self.metrics.pop("error", None)
+                self._ready.clear()
+                self._thread = None
+            run_now = callback is not None and self._ready.is_set()
+            if callback is not None and not run_now:
+                self._callbacks.append(callback)
+            if self._thread is None:
+                self.metrics["state"] = "warming"
+                self._thread = threading.Thread(target=self._wait, name="food-server-wait", daemon=True)
+                self._thread.start()
+        if run_now:
+            callback(self)
+
+    def _wait(self):
+        start = time.perf_counter()
+        while True:
+            try:
+                state = _request(self.address, "GET", "/health", timeout=5.0)["state"]
+            except (OSError, RuntimeError, ValueError):
+                state = "unreachable"
+            if state == "ready":
+                self.metrics.update({"state": "ready", "total_seconds": round(time.perf_counter() - start, 3)})
+                break
+            if state == "error" or time.perf_counter() - start > WARMUP_TIMEOUT:
+                self.error = RuntimeError(f"Сервер проверки еды {self.address}: {state}")
+                self.metrics.update({"state": "error", "error": str(self.error)})
+                break
+            time.sleep(self.poll_seconds)
+
+        with self._lock:
+            self._ready.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class FoodClient:
+    """То же, что FoodClassifier.classify, но проверку делает сервер"""
+
+    def __init__(self, address):
+        self.address = address
+        self.provider = RemoteProvider(address)
+
+    def start(self, callback=None):
+        self.provider.start(callback)
+
+    def classify(self, image) -> Prediction:
+        """Фото по пути или байтами"""
+        if not isinstance(image, (bytes, bytearray)):
+            with open(image, "rb") as f:
+                image = f.read()
+        return Prediction(**_request(self.address, "POST", "/classify", body=bytes(image)))
+
+    def classify_batch(self, images) -> list:
+        return [self.classify(image) for image in images]
+
+
+# === Нагрузочный тест ===
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+class _SimulatedClassifier:
+    """Имитация модели для проверки пакетирования без CLIP: проход стоит base + per_image"""
+
+    def __init__(self, base=0.030, per_image=0.004):
+        from clip_model import ModelProvider
+
+        self.base = base
+        self.per_image = per_image
+        self.provider = ModelProvider()
+        self.provider.metrics["state"] = "ready"
+
+    def start(self, callback=None):
+        pass
+
+    def classify_batch(self, images):
+        time.sleep(self.base + self.per_image * len(images))
+        return [Prediction("fresh food", "edible", 0.3, []) for _ in images]
+
+
+def benchmark(image_path, windows=(0.0, 0.005, 0.01, 0.02), clients=16, requests=400, simulate=False):
+    """p50/p99 и запросов в секунду при разных окнах пакетирования"""
+    with open(image_path, "rb") as f:
+        image = f.read()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if simulate:
+            classifier = _SimulatedClassifier()
+        else:
+            from result_cache import ResultCache
+
+            # Отдельный пустой кэш, иначе все повторы одного фото - попадания
+            classifier = FoodClassifier(cache=ResultCache(os.path.join(tmp, "bench.db")))
+            classifier.provider.get()
+
+        print(f"клиентов: {clients}, запросов: {requests}, {'имитация модели' if simulate else 'CLIP'}")
+        print(f"{'окно, мс':>9} {'p50, мс':>9} {'p99, мс':>9} {'запросов/с':>11} {'средняя пачка':>14}")
+        for window in windows:
+            server = FoodServer(classifier, port=0, window=window).start()
+            address = f"{server.host}:{server.port}"
+            latencies = []
+            counter = iter(range(requests))
+            lock = threading.Lock()
+
+            def worker():
+                rng = random.Random()
+                while True:
+                    with lock:
+                        if next(counter, None) is None:
+                            return
+                    # Хвост после конца JPEG декодер не читает, а хэш фото становится новым
+                    body = image + rng.randbytes(16)
+                    start = time.perf_counter()
+                    _request(address, "POST", "/classify", body=body)
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            stats = server.batcher.stats
+            server.close()
+
+            print(f"{window * 1000:>9.0f} {percentile(latencies, 0.50) * 1000:>9.1f} "
+                  f"{percentile(latencies, 0.99) * 1000:>9.1f} {len(latencies) / elapsed:>11.1f} "
+                  f"{stats['requests'] / max(stats['batches'], 1):>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP-сервер проверки еды с пакетной обработкой")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="запустить сервер")
+    serve.add_argument("--host", default=HOST)
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--window-ms", type=float, default=WINDOW * 1000)
+    serve.add_argument("--max-batch", type=int, default=MAX_BATCH)
+
+    bench = sub.add_parser("bench", help="нагрузочный тест с клиентами в этом же процессе")
+    bench.add_argument("--image", default="input_image.jpg", help="JPEG, который шлют клиенты")
+    bench.add_argument("--windows-ms", type=float, nargs="+", default=[0, 5, 10, 20])
+    bench.add_argument("--clients", type=int, default=16)
+    bench.add_argument("--requests", type=int, default=400)
+    bench.add_argument("--simulate", action="store_true", help="без CLIP, модель имитируется задержкой")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = FoodServer(host=args.host, port=args.port, window=args.window_ms / 1000,
+                            max_batch=args.max_batch)
+        print(f"Сервер проверки еды запущен на {server.host}:{server.port} "
+              f"(окно {args.window_ms:.0f} мс, пачка до {args.max_batch})")
+        server.serve_forever()
+    else:
+        benchmark(args.image, [w / 1000 for w in args.windows_ms], args.clients, args.requests, args.simulate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+from kivy.clock import Clock
+
+# === Очередь проверок в фоновом потоке ===
+# Декодирование фото и проход CLIP идут в отдельном потоке, а результат
+# возвращается в главный поток Kivy через Clock.schedule_once.
+
+
+def post_to_kivy(callback, *args):
+    """Вызывает callback в главном потоке Kivy"""
+    Clock.schedule_once(lambda dt: callback(*args))
+
+
+class Job:
+    """Задача в очереди; на один ключ может быть подписано несколько экранов"""
+
+    def __init__(self, key, fn):
+        self.key = key
+        self.fn = fn
+        self.subscribers = []  # [(owner, callback)]
+
+
+class InferenceService:
+    """Одна рабочая нить, склейка одинаковых запросов и отмена устаревших"""
+
+    def __init__(self, name="inference", post=post_to_kivy):
+        self.name = name
+        self.post = post
+        self.stats = {"submitted": 0, "coalesced": 0, "cancelled": 0, "done": 0, "failed": 0}
+        self._cond = threading.Condition()
+        self._queue = OrderedDict()  # key -> Job, в порядке поступления
+        self._running = None
+        self._thread = None
+
+    def submit(self, key, fn, callback, owner=None, exclusive=True):
+        """Ставит fn() в очередь; callback(result, error) вызовется в главном потоке.
+
+        Если задача с тем же ключом уже ждёт или выполняется, новая не создаётся.
+        При exclusive=True прежние запросы того же owner отменяются.
+        """
+        with self._cond:
+            if exclusive and owner is not None:
+                self._cancel_locked(owner, keep_key=key)
+
+            self.stats["submitted"] += 1
+            job = self._queue.get(key)
+            if job is None and self._running is not None and self._running.key == key:
+                job = self._running
+
+            if job is None:
+                job = Job(key, fn)
+                self._queue[key] = job
+            else:
+                self.stats["coalesced"] += 1
+
+            if (owner, callback) not in job.subscribers:
+                job.subscribers.append((owner, callback))
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job
+
+    def cancel(self, owner) -> int:
+        """Отменяет все запросы owner (например, при уходе с экрана)"""
+        with self._cond:
+            return self._cancel_locked(owner)
+
+    def _cancel_locked(self, owner, keep_key=None):
+        jobs = list(self._queue.values())
+        if self._running is not None:
+            jobs.append(self._running)
+
+        cancelled = 0
+        for job in jobs:
+            if job.key == keep_key:
+                continue
+            before = len(job.subscribers)
+            job.subscribers = [(o, cb) for o, cb in job.subscribers if o is not owner]
+            cancelled += before - len(job.subscribers)
+            # Ждущую задачу без подписчиков выкидываем; выполняющуюся прервать
+            # нельзя, её результат просто никому не отправится
+            if not job.subscribers and job is not self._running:
+                del self._queue[job.key]
+
+        self.stats["cancelled"] += cancelled
+        return cancelled
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue) + (1 if self._running is not None else 0)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, job = self._queue.popitem(last=False)
+                self._running = job
+
+            result, error = None, None
+            try:
+                result = job.fn()
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._running = None
+                subscribers = job.subscribers
+                self.stats["failed" if error is not None else "done"] += 1
+
+            for owner, callback in subscribers:
+                self.post(callback, result, error)
@@ -0,0 +1,203 @@
+import time
+import random
+import argparse
+
+# === Рейтинг пользователей по заработанным баллам ===
+# Индексируемый skip-list: элементы упорядочены по (-баллы, логин), а у каждой
+# ссылки хранится её "ширина" - сколько элементов она перепрыгивает. Поэтому
+# вставка, удаление, место пользователя и переход к N-й позиции стоят O(log n),
+# а страница из k строк - O(log n + k). Весь список при начислении не сортируем.
+MAX_LEVEL = 32  # хватает на ~4 млрд элементов
+PAGE_SIZE = 10
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """Упорядоченный набор ключей с доступом по номеру позиции"""
+
+    def __init__(self, seed=None):
+        self._tail = _Node(None, 0)
+        self._head = _Node(None, MAX_LEVEL)
+        self._head.next = [self._tail] * MAX_LEVEL
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self._size
+
+    def _level(self):
+        level = 1
+        while level < MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def _find(self, key):
+        """Для каждого уровня - последний узел с ключом меньше key и его позиция"""
+        chain = [None] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node, position = self._head, 0
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not self._tail and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self._find(key)
+        level = self._level()
+        node = _Node(key, level)
+        for i in range(level):
+            prev = chain[i]
+            skipped = positions[0] - positions[i]  # сколько элементов между prev и новым узлом
+            node.next[i] = prev.next[i]
+            prev.next[i] = node
+            node.width[i] = prev.width[i] - skipped
+            prev.width[i] = skipped + 1
+        for i in range(level, MAX_LEVEL):
+            chain[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._find(key)
+        node = chain[0].next[0]
+        if node is self._tail or node.key != key:
+            raise KeyError(key)
+        for i in range(MAX_LEVEL):
+            prev = chain[i]
+            if i < len(node.next):
+                prev.width[i] += node.width[i] - 1
+                prev.next[i] = node.next[i]
+            else:
+                prev.width[i] -= 1
+        self._size -= 1
+
+    def index(self, key) -> int:
+        """Позиция ключа (с нуля); KeyError, если его нет"""
+        chain, positions = self._find(key)
+        node = chain[0].next[0]
+        if node is self._tail or node.key != key:
+            raise KeyError(key)
+        return positions[0]
+
+    def slice(self, start, count) -> list:
+        """До count ключей, начиная с позиции start"""
+        if start < 0 or start >= self._size:
+            return []
+        node, remaining = self._head, start + 1
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not self._tail and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not self._tail and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """Рейтинг по total_points, обновляется при каждом начислении в журнале баллов"""
+
+    def __init__(self, ledger=None, seed=None):
+        self._scores = {}
+        self._index = IndexableSkipList(seed)
+        if ledger is not None:
+            for user, score in ledger.totals().items():
+                self.update(user, score)
+            ledger.subscribe(self.on_events)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def update(self, user, score):
+        """Ставит пользователю новый счёт"""
+        old = self._scores.get(user)
+        if old == score:
+            return
+        if old is not None:
+            self._index.remove((-old, user))
+        self._scores[user] = score
+        self._index.insert((-score, user))
+
+    def on_events(self, events):
+        """Подписчик PointsLedger: в рейтинг идут только начисления, траты его не меняют"""
+        for event in events:
+            if event["delta"] > 0:
+                self.update(event["user"], self._scores.get(event["user"], 0) + event["delta"])
+
+    def score(self, user) -> int:
+        return self._scores.get(user, 0)
+
+    def rank(self, user):
+        """Место пользователя (с единицы) или None, если баллов у него нет"""
+        score = self._scores.get(user)
+        if score is None:
+            return None
+        return self._index.index((-score, user)) + 1
+
+    def page(self, number=0, size=PAGE_SIZE) -> list:
+        """Страница рейтинга: [(место, логин, баллы), ...]"""
+        start = number * size
+        return [(start + i + 1, user, -score)
+                for i, (score, user) in enumerate(self._index.slice(start, size))]
+
+    def top(self, n=3) -> list:
+        return self.page(0, n)
+
+
+def benchmark(sizes, queries=10000, seed=0):
+    """Стоимость начисления, места пользователя и страницы при росте числа пользователей"""
+    print(f"{'пользов.':>9} {'сборка, с':>9} {'начисл., мкс':>12} {'место, мкс':>10} "
+          f"{'стр., мкс':>9} {'сорт. всех, мс':>14}")
+    rng = random.Random(seed)
+    for n in sizes:
+        users = [f"user{i}" for i in range(n)]
+        board = Leaderboard(seed=seed)
+
+        start = time.perf_counter()
+        for user in users:
+            board.update(user, rng.randrange(10000))
+        build = time.perf_counter() - start
+
+        sample = [rng.choice(users) for _ in range(queries)]
+
+        start = time.perf_counter()
+        for user in sample:
+            board.on_events([{"user": user, "delta": 10}])
+        award = (time.perf_counter() - start) / queries
+
+        start = time.perf_counter()
+        for user in sample:
+            board.rank(user)
+        rank = (time.perf_counter() - start) / queries
+
+        start = time.perf_counter()
+        for i in range(queries):
+            board.page(rng.randrange(max(1, n // PAGE_SIZE)))
+        page = (time.perf_counter() - start) / queries
+
+        # Для сравнения - как было раньше: сортировка всех пользователей на каждый запрос
+        start = time.perf_counter()
+        sorted(board._scores.items(), key=lambda item: item[1], reverse=True)[:PAGE_SIZE]
+        full_sort = time.perf_counter() - start
+
+        print(f"{n:>9} {build:>9.2f} {award * 1e6:>12.1f} {rank * 1e6:>10.1f} "
+              f"{page * 1e6:>9.1f} {full_sort * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк рейтинга пользователей")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=10000)
+    args = parser.parse_args()
+    benchmark(args.sizes, args.queries)
@@ -0,0 +1,265 @@
+import csv
+import math
+import json
+import time
+import random
+import argparse
+
+from assets import get_assets
+from tile_cache import CITY_BBOX, CITY_CENTER
+
+try:
+    from kivy.uix.label import Label
+    from kivy_garden.mapview import MapMarker, MarkerMapLayer
+except ImportError:  # индекс и бенчмарк работают и без Kivy
+    MapMarker = MarkerMapLayer = object
+
+# === Слой контейнеров на карте ===
+# Точки грузятся из CSV или GeoJSON в сеточный индекс. Маркеры создаются
+# только для видимой области. При мелком масштабе близкие точки
+# объединяются в один маркер с числом. При прокрутке слой сравнивает новый
+# набор с уже показанным и трогает только то, что изменилось.
+CONTAINERS_FILE = "containers.csv"
+ICON = "cache/eco_bin_icon.jpg"
+HIGHLIGHT_ICON = "map_icon.png"
+MARKER_SIZE = (40, 40)  # значки уменьшаются до этого размера и кладутся в общий атлас
+
+CELL_DEG = 0.002        # ячейка сетки индекса (~200 м)
+CLUSTER_PX = 60         # размер ячейки кластера на экране
+CLUSTER_MAX_ZOOM = 16   # начиная с этого масштаба показываем каждую точку
+TILE_SIZE = 256
+MARGIN_PX = 48          # маркеры у края появляются чуть раньше, чем въедут в экран
+
+
+def load_containers(path=CONTAINERS_FILE) -> list:
+    """Точки из CSV (id,lat,lon,name) или GeoJSON (Point): [{"id","lat","lon","name"}]"""
+    if path.endswith((".geojson", ".json")):
+        with open(path, "r", encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        containers = []
+        for i, feature in enumerate(features):
+            lon, lat = feature["geometry"]["coordinates"][:2]
+            props = feature.get("properties") or {}
+            containers.append({"id": str(props.get("id", feature.get("id", i))), "lat": lat, "lon": lon,
+                               "name": props.get("name", "")})
+        return containers
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return [{"id": row["id"], "lat": float(row["lat"]), "lon": float(row["lon"]),
+                 "name": row.get("name", "")} for row in csv.DictReader(f)]
+
+
+def world_xy(lat, lon):
+    """Координаты в проекции Меркатора, доли от 0 до 1 (как у тайлов)"""
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0
+    return x, y
+
+
+class ContainerIndex:
+    """Сеточный индекс точек и кластеры по масштабам (считаются один раз на масштаб)"""
+
+    def __init__(self, containers, cell_deg=CELL_DEG):
+        self.containers = containers
+        self.cell_deg = cell_deg
+        self._grid = {}
+        self._world = [world_xy(c["lat"], c["lon"]) for c in containers]
+        self._clusters = {}  # zoom -> {ячейка: [сумма lat, сумма lon, число, индекс точки]}
+        for i, c in enumerate(containers):
+            self._grid.setdefault(self._cell(c["lat"], c["lon"]), []).append(i)
+
+    def __len__(self):
+        return len(self.containers)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def query(self, bbox) -> list:
+        """Индексы точек внутри прямоугольника (lat_min, lon_min, lat_max, lon_max)"""
+        lat_min, lon_min, lat_max, lon_max = bbox
+        r0, c0 = self._cell(lat_min, lon_min)
+        r1, c1 = self._cell(lat_max, lon_max)
+        found = []
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                for i in self._grid.get((r, c), ()):
+                    point = self.containers[i]
+                    if lat_min <= point["lat"] <= lat_max and lon_min <= point["lon"] <= lon_max:
+                        found.append(i)
+        return found
+
+    def _clusters_for(self, zoom):
+        clusters = self._clusters.get(zoom)
+        if clusters is None:
+            scale = TILE_SIZE * 2 ** zoom / CLUSTER_PX
+            clusters = {}
+            for i, (x, y) in enumerate(self._world):
+                key = (int(x * scale), int(y * scale))
+                cluster = clusters.get(key)
+                if cluster is None:
+                    clusters[key] = [self.containers[i]["lat"], self.containers[i]["lon"], 1, i]
+                else:
+                    cluster[0] += self.containers[i]["lat"]
+                    cluster[1] += self.containers[i]["lon"]
+                    cluster[2] += 1
+            self._clusters[zoom] = clusters
+        return clusters
+
+    def visible(self, bbox, zoom) -> dict:
+        """Что показать: {ключ: (lat, lon, число точек, индекс точки или None)}"""
+        zoom = int(zoom)
+        if zoom >= CLUSTER_MAX_ZOOM:
+            return {("p", i): (self.containers[i]["lat"], self.containers[i]["lon"], 1, i)
+                    for i in self.query(bbox)}
+
+        clusters = self._clusters_for(zoom)
+        scale = TILE_SIZE * 2 ** zoom / CLUSTER_PX
+        lat_min, lon_min, lat_max, lon_max = bbox
+        x0, y0 = world_xy(lat_max, lon_min)
+        x1, y1 = world_xy(lat_min, lon_max)
+        cx0, cy0, cx1, cy1 = int(x0 * scale), int(y0 * scale), int(x1 * scale), int(y1 * scale)
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) < len(clusters):
+            keys = ((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1))
+        else:
+            keys = (key for key in clusters if cx0 <= key[0] <= cx1 and cy0 <= key[1] <= cy1)
+
+        shown = {}
+        for key in keys:
+            cluster = clusters.get(key)
+            if cluster is None:
+                continue
+            lat_sum, lon_sum, count, first = cluster
+            if count == 1:
+                shown[("p", first)] = (lat_sum, lon_sum, 1, first)
+            else:
+                shown[("c", zoom) + key] = (lat_sum / count, lon_sum / count, count, None)
+        return shown
+
+
+class ClusterMarker(MapMarker):
+    """Маркер группы контейнеров с их числом поверх значка"""
+
+    def __init__(self, count, **kwargs):
+        super().__init__(**kwargs)
+        self.label = Label(text=str(count), bold=True, font_size=14, color=(1, 1, 1, 1))
+        self.add_widget(self.label)
+        self.bind(pos=self._place_label, size=self._place_label)
+
+    def _place_label(self, *args):
+        self.label.size = self.size
+        self.label.pos = self.pos
+
+
+class ContainerLayer(MarkerMapLayer):
+    """Слой MapView: маркеры только для видимой области, с кластерами и обновлением по разнице"""
+
+    def __init__(self, containers, icon=ICON, **kwargs):
+        super().__init__(**kwargs)
+        self.index = containers if isinstance(containers, ContainerIndex) else ContainerIndex(containers)
+        self.icon = icon
+        self.highlighted = []  # индексы выделенных контейнеров, см. highlight()
+        self._shown = {}  # ключ -> маркер
+
+    def reposition(self):
+        mapview = self.parent
+        if mapview is None:
+            return
+        wanted = self.index.visible(mapview.get_bbox(MARGIN_PX), mapview.zoom)
+        for i in self.highlighted:
+            # выделенные показываем отдельно, даже если они попали в группу
+            wanted.pop(("p", i), None)
+            container = self.index.containers[i]
+            wanted[("h", i)] = (container["lat"], container["lon"], 1, i)
+
+        for key in [key for key in self._shown if key not in wanted]:
+            self.remove_widget(self._shown.pop(key))
+        for key, (lat, lon, count, point) in wanted.items():
+            if key not in self._shown:
+                self._shown[key] = self._make_marker(lat, lon, count, point, key[0] == "h")
+                self.add_widget(self._shown[key])
+
+        super().reposition()
+
+    def _make_marker(self, lat, lon, count, point, highlighted=False):
+        # source="" - маркер не грузит картинку сам, текстура берётся из общего атласа
+        if count == 1:
+            marker = MapMarker(lat=lat, lon=lon, source="")
+            marker.texture = get_assets().icon(HIGHLIGHT_ICON if highlighted else self.icon, MARKER_SIZE)
+            marker.container = self.index.containers[point]
+        else:
+            marker = ClusterMarker(count, lat=lat, lon=lon, source="")
+            marker.texture = get_assets().icon(self.icon, MARKER_SIZE)
+            marker.bind(on_release=self.zoom_into)
+        return marker
+
+    def highlight(self, points):
+        """Выделяет контейнеры (индексы) другим значком"""
+        self.highlighted = list(points)
+        self.reposition()
+
+    def zoom_into(self, marker):
+        """Нажатие на группу: приблизить карту к ней"""
+        mapview = self.parent
+        mapview.zoom = min(mapview.zoom + 2, CLUSTER_MAX_ZOOM)
+        mapview.center_on(marker.lat, marker.lon)
+
+
+def random_containers(n, bbox=CITY_BBOX, seed=0) -> list:
+    rng = random.Random(seed)
+    lat_min, lon_min, lat_max, lon_max = bbox
+    return [{"id": str(i), "lat": rng.uniform(lat_min, lat_max), "lon": rng.uniform(lon_min, lon_max),
+             "name": ""} for i in range(n)]
+
+
+def benchmark(n=10000, frames=600, seed=0):
+    """Работа слоя на кадр при прокрутке и смене масштаба (без отрисовки Kivy)"""
+    containers = random_containers(n, seed=seed)
+    index = ContainerIndex(containers)
+    rng = random.Random(seed)
+
+    span = {12: 0.25, 13: 0.12, 14: 0.06, 15: 0.03, 16: 0.015, 17: 0.008}  # видимая область, градусы
+    center_lat, center_lon = CITY_CENTER
+    zoom = 14
+    shown = set()
+    layer_times, naive_times, sizes = [], [], []
+    for frame in range(frames):
+        if frame % 60 == 0:
+            zoom = rng.choice(list(span))
+        center_lat += rng.uniform(-0.1, 0.1) * span[zoom]
+        center_lon += rng.uniform(-0.1, 0.1) * span[zoom]
+        d = span[zoom] / 2
+        bbox = (center_lat - d / 2, center_lon - d, center_lat + d / 2, center_lon + d)
+
+        start = time.perf_counter()
+        wanted = index.visible(bbox, zoom)
+        removed = shown - wanted.keys()
+        added = wanted.keys() - shown
+        shown = set(wanted)
+        layer_times.append(time.perf_counter() - start)
+        sizes.append((len(shown), len(added) + len(removed)))
+
+        # Как делает стандартный MarkerMapLayer: проверка каждого из n маркеров
+        start = time.perf_counter()
+        sorted((c for c in containers), key=lambda c: -c["lat"])
+        [c for c in containers if bbox[0] <= c["lat"] <= bbox[2] and bbox[1] <= c["lon"] <= bbox[3]]
+        naive_times.append(time.perf_counter() - start)
+
+    def report(name, times):
+        times = sorted(times)
+        print(f"  {name}: среднее {sum(times) / len(times) * 1000:.3f} мс, "
+              f"p99 {times[int(len(times) * 0.99)] * 1000:.3f} мс")
+
+    print(f"точек: {n}, кадров: {frames}")
+    report("слой с индексом     ", layer_times)
+    report("все маркеры на карте", naive_times)
+    print(f"  маркеров на экране: в среднем {sum(s for s, _ in sizes) / len(sizes):.0f}, "
+          f"изменений за кадр: {sum(c for _, c in sizes) / len(sizes):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк слоя контейнеров")
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--frames", type=int, default=600)
+    args = parser.parse_args()
+    benchmark(args.points, args.frames)
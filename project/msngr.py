@@ -1,40 +1,23 @@
 import os
-import hashlib
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.screenmanager import ScreenManager, Screen, FadeTransition
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
-from kivy.uix.scrollview import ScrollView
-
-# === Работа с пользователями ===
-def init_file():
-    if not os.path.exists('users.txt'):
-        with open('users.txt', 'w'):
-            pass
-
-def add_user(login: str, password: str) -> bool:
-    with open('users.txt', 'r') as f:
-        users = f.read().splitlines()
-    for user in users:
-        args = user.split(':')
-        if login == args[0]:
-            return False
-    with open('users.txt', 'a') as f:
-        f.write(f'{login}:{password}\n')
-    return True
-
-def get_user(login: str, password: str) -> bool:
-    with open('users.txt', 'r') as f:
-        users = f.read().splitlines()
-    for user in users:
-        args = user.split(':')
-        if login == args[0] and password == args[1]:
-            return True
-    return False
-
-init_file()
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+
+from passwords import get_service
+from chat_store import ChatStore
+from chat_relay import RelayClient
+
+# Общий чат через сервер: CHAT_RELAY=127.0.0.1:8765 (python chat_relay.py serve)
+RELAY_ADDRESS = os.environ.get("CHAT_RELAY")
+
+credentials = get_service()  # пароли проверяются в фоновом пуле потоков
+chat_store = None if RELAY_ADDRESS else ChatStore()  # история чата на диске, см. chat_store.py
 
 # === Хранилище текущего пользователя ===
 class UserData:
@@ -68,8 +51,16 @@ class AuthScreen(Screen):
 
     def login(self, instance):
         login = self.login_input.text.strip()
-        password = hashlib.sha256(self.password_input.text.strip().encode()).hexdigest()
-        if get_user(login, password):
+        password = self.password_input.text.strip()
+        self.message.text = "Проверяем..."
+        credentials.login(login, password, lambda ok, error: self.on_login(login, ok, error))
+
+    def on_login(self, login, ok, error=None):
+        """Результат проверки пароля (вызывается в главном потоке)"""
+        self.message.text = ""
+        if error is not None:
+            self.message.text = f"Ошибка базы пользователей: {error}"
+        elif ok:
             UserData.login = login
             self.manager.current = "chat"
         else:
@@ -81,24 +72,35 @@ class AuthScreen(Screen):
         if not login or not password:
             self.message.text = "Введите логин и пароль!"
             return
-        password_hashed = hashlib.sha256(password.encode()).hexdigest()
-        if add_user(login, password_hashed):
+        self.message.text = "Регистрируем..."
+        credentials.register(login, password, self.on_register)
+
+    def on_register(self, created, error=None):
+        """Результат регистрации (вызывается в главном потоке)"""
+        if error is not None:
+            self.message.text = f"Ошибка базы пользователей: {error}"
+        elif created:
             self.message.text = "Регистрация успешна! Теперь войдите."
         else:
             self.message.text = "Пользователь уже существует!"
 
 # === Экран чата ===
 class ChatScreen(Screen):
-    messages = []
+    MAX_ROWS = 500  # столько сообщений держим в списке, старые подгружаются при прокрутке вверх
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
-        self.scroll = ScrollView(size_hint=(1, 0.8))
-        self.chat_box = BoxLayout(orientation='vertical', size_hint_y=None)
+
+        # RecycleView создаёт виджеты только для видимых строк и переиспользует их
+        self.chat_view = RecycleView(size_hint=(1, 0.8))
+        self.chat_view.viewclass = "Label"
+        self.chat_box = RecycleBoxLayout(orientation='vertical', size_hint_y=None,
+                                         default_size=(None, 30), default_size_hint=(1, None))
         self.chat_box.bind(minimum_height=self.chat_box.setter('height'))
-        self.scroll.add_widget(self.chat_box)
-        self.layout.add_widget(self.scroll)
+        self.chat_view.add_widget(self.chat_box)
+        self.chat_view.bind(scroll_y=self.on_chat_scroll)
+        self.layout.add_widget(self.chat_view)
 
         self.input_box = BoxLayout(size_hint=(1, 0.1), spacing=10)
         self.msg_input = TextInput(multiline=False)
@@ -114,18 +116,88 @@ class ChatScreen(Screen):
 
         self.add_widget(self.layout)
 
+        # В списке всегда подряд идущие сообщения oldest_id..newest_id
+        self.oldest_id = 0
+        self.newest_id = -1
+        self.page_requested = False
+        self.relay = None
+        if RELAY_ADDRESS:
+            host, port = RELAY_ADDRESS.rsplit(":", 1)
+            self.relay = RelayClient(lambda event: Clock.schedule_once(lambda dt: self.on_relay_event(event)),
+                                     host, int(port))
+        self.load_history()
+
+    @staticmethod
+    def row(record):
+        return {"text": f"{record['user']}: {record['text']}"}
+
+    def load_history(self):
+        """Показывает последнюю страницу истории"""
+        if self.relay is None:
+            self.show_records(chat_store.page())
+
+    def show_records(self, records):
+        self.chat_view.data = [self.row(r) for r in records]
+        if records:
+            self.oldest_id = records[0]["id"]
+            self.newest_id = records[-1]["id"]
+        self.chat_view.scroll_y = 0
+
+    def prepend_records(self, records):
+        self.page_requested = False
+        if records:
+            self.oldest_id = records[0]["id"]
+            self.chat_view.data = [self.row(r) for r in records] + self.chat_view.data
+
+    def on_chat_scroll(self, view, scroll_y):
+        """Долистали до верха - подгружаем предыдущую страницу"""
+        if scroll_y < 1 or self.oldest_id <= 0 or self.page_requested:
+            return
+        if self.relay is not None:
+            self.page_requested = True
+            self.relay.request_page(before=self.oldest_id)
+        else:
+            self.prepend_records(chat_store.page(before=self.oldest_id))
+
+    def on_relay_event(self, event):
+        """Событие от чат-сервера (вызывается в главном потоке)"""
+        self.msg_input.hint_text = ""  # связь есть
+        if event["type"] == "history":
+            messages = event["messages"]
+            if self.newest_id < 0 or (messages and messages[0]["id"] > self.newest_id + 1):
+                # первый вход или пропущено больше, чем сервер отдаёт (chat_relay.MAX_HISTORY)
+                self.show_records(messages)
+            else:
+                # переподключились - сервер прислал только пропущенные сообщения
+                for record in messages:
+                    self.add_record(record)
+        elif event["type"] == "page":
+            self.prepend_records(event["messages"])
+        elif event["type"] == "message":
+            self.add_record(event["message"])
+
     def send_message(self, instance):
         msg = self.msg_input.text.strip()
         if msg:
-            full_msg = f"{UserData.login}: {msg}"
-            ChatScreen.messages.append(full_msg)
-            self.update_chat()
+            if self.relay is not None:
+                # вернётся к нам рассылкой от сервера; без связи ждёт в очереди клиента
+                if not self.relay.send(UserData.login, msg):
+                    self.msg_input.hint_text = "Нет связи с сервером, сообщения уйдут после подключения"
+            else:
+                self.add_record(chat_store.append(UserData.login, msg))
             self.msg_input.text = ""
 
-    def update_chat(self):
-        self.chat_box.clear_widgets()
-        for msg in ChatScreen.messages:
-            self.chat_box.add_widget(Label(text=msg, size_hint_y=None, height=30))
+    def add_record(self, record):
+        """Добавляет одно сообщение в конец, не перестраивая остальные"""
+        if record["id"] <= self.newest_id:
+            return
+        data = self.chat_view.data
+        data.append(self.row(record))
+        if len(data) > self.MAX_ROWS:
+            del data[:len(data) - self.MAX_ROWS]
+        self.newest_id = record["id"]
+        self.oldest_id = self.newest_id - len(data) + 1
+        self.chat_view.scroll_y = 0
 
     def logout(self, instance):
         UserData.login = None
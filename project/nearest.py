@@ -0,0 +1,191 @@
+import math
+import time
+import heapq
+import random
+import argparse
+
+from tile_cache import CITY_BBOX
+
+# === Поиск ближайших контейнеров ===
+# Точки переводим в единичные векторы на сфере и строим по ним KD-дерево.
+# Расстояние по хорде монотонно расстоянию по поверхности, поэтому k
+# ближайших по хорде - это и k ближайших на местности. Поиск не ломается
+# около полюсов и линии перемены дат. Метры для ответа считаем по формуле
+# гаверсинусов. Для массовых запросов (много точек сразу) есть
+# векторизованный вариант на NumPy.
+EARTH_RADIUS_M = 6371008.8
+LEAF_SIZE = 16
+
+
+def to_xyz(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> float:
+    """Расстояние между точками по поверхности Земли, в метрах"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class KDTree:
+    """KD-дерево по трёхмерным точкам; листья - пачки до LEAF_SIZE точек"""
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = points
+        self.leaf_size = leaf_size
+        self._order = list(range(len(points)))
+        # Узлы в параллельных списках: ось (-1 у листа), граница, дети, диапазон в _order
+        self._axis, self._split, self._left, self._right, self._start, self._end = [], [], [], [], [], []
+        self.root = self._build(0, len(points)) if points else -1
+
+    def _node(self, axis, split, left, right, start, end):
+        self._axis.append(axis)
+        self._split.append(split)
+        self._left.append(left)
+        self._right.append(right)
+        self._start.append(start)
+        self._end.append(end)
+        return len(self._axis) - 1
+
+    def _build(self, start, end):
+        if end - start <= self.leaf_size:
+            return self._node(-1, 0.0, -1, -1, start, end)
+        chunk = self._order[start:end]
+        spreads = []
+        for axis in range(3):
+            values = [self.points[i][axis] for i in chunk]
+            spreads.append(max(values) - min(values))
+        axis = spreads.index(max(spreads))
+        chunk.sort(key=lambda i: self.points[i][axis])
+        self._order[start:end] = chunk
+        middle = (start + end) // 2
+        split = self.points[self._order[middle]][axis]
+        node = self._node(axis, split, -1, -1, start, end)
+        self._left[node] = self._build(start, middle)
+        self._right[node] = self._build(middle, end)
+        return node
+
+    def query(self, q, k=1):
+        """k ближайших: [(квадрат расстояния, индекс точки), ...] от ближнего к дальнему"""
+        if self.root < 0:
+            return []
+        qx, qy, qz = q
+        best = []  # куча с обратным знаком: на вершине - самый дальний из найденных
+        stack = [(self.root, 0.0)]
+        points, order = self.points, self._order
+        while stack:
+            node, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            axis = self._axis[node]
+            if axis < 0:
+                for i in order[self._start[node]:self._end[node]]:
+                    x, y, z = points[i]
+                    d = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+                continue
+            diff = q[axis] - self._split[node]
+            near, far = (self._left[node], self._right[node]) if diff < 0 else (self._right[node], self._left[node])
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return sorted((-d, i) for d, i in best)
+
+
+class NearestContainers:
+    """k ближайших контейнеров к точке и массовый поиск ближайшего"""
+
+    def __init__(self, containers):
+        self.containers = containers
+        self.tree = KDTree([to_xyz(c["lat"], c["lon"]) for c in containers])
+
+    def __len__(self):
+        return len(self.containers)
+
+    def nearest(self, lat, lon, k=1) -> list:
+        """[(расстояние в метрах, индекс контейнера), ...] от ближнего к дальнему"""
+        return [(haversine_m(lat, lon, self.containers[i]["lat"], self.containers[i]["lon"]), i)
+                for _, i in self.tree.query(to_xyz(lat, lon), k)]
+
+    def bulk_nearest(self, coords, chunk=256):
+        """Ближайший контейнер для каждой из точек [(lat, lon), ...]: [(метры, индекс), ...]
+
+        С NumPy считается матрица расстояний кусками по chunk запросов,
+        без NumPy - обычный поиск по дереву для каждой точки.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.nearest(lat, lon)[0] for lat, lon in coords]
+
+        lat2 = np.radians([c["lat"] for c in self.containers])[None, :]
+        lon2 = np.radians([c["lon"] for c in self.containers])[None, :]
+        cos_lat2 = np.cos(lat2)
+        query = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+        result = []
+        for start in range(0, len(query), chunk):
+            lat1 = query[start:start + chunk, :1]
+            lon1 = query[start:start + chunk, 1:]
+            a = (np.sin((lat2 - lat1) / 2) ** 2
+                 + np.cos(lat1) * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2)
+            best = a.argmin(axis=1)
+            a_min = a[np.arange(len(best)), best]
+            meters = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a_min, 1.0)))
+            result.extend(zip(meters.tolist(), best.tolist()))
+        return result
+
+
+def random_points(n, bbox=CITY_BBOX, seed=0) -> list:
+    rng = random.Random(seed)
+    lat_min, lon_min, lat_max, lon_max = bbox
+    return [{"lat": rng.uniform(lat_min, lat_max), "lon": rng.uniform(lon_min, lon_max)} for _ in range(n)]
+
+
+def benchmark(n=100000, queries=2000, k=5, bulk=2000, seed=0):
+    """Построение дерева, задержка одного запроса и массовый поиск"""
+    containers = random_points(n, seed=seed)
+    probes = [(p["lat"], p["lon"]) for p in random_points(queries, seed=seed + 1)]
+
+    start = time.perf_counter()
+    index = NearestContainers(containers)
+    print(f"точек: {n}, дерево построено за {time.perf_counter() - start:.2f} с")
+
+    # Проверяем на части запросов, что дерево даёт то же, что полный перебор
+    for lat, lon in probes[:20]:
+        brute = min(range(n), key=lambda i: haversine_m(lat, lon, containers[i]["lat"], containers[i]["lon"]))
+        assert index.nearest(lat, lon)[0][1] == brute
+
+    for kk in (1, k):
+        times = []
+        for lat, lon in probes:
+            start = time.perf_counter()
+            index.nearest(lat, lon, kk)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        print(f"  k={kk}: среднее {sum(times) / len(times) * 1e6:.0f} мкс, "
+              f"p99 {times[int(len(times) * 0.99)] * 1e6:.0f} мкс")
+
+    coords = probes[:bulk]
+    start = time.perf_counter()
+    for lat, lon in coords:
+        index.nearest(lat, lon)
+    tree_time = time.perf_counter() - start
+    start = time.perf_counter()
+    index.bulk_nearest(coords)
+    bulk_time = time.perf_counter() - start
+    print(f"  {len(coords)} запросов: дерево {tree_time * 1000:.0f} мс, bulk_nearest {bulk_time * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска ближайших контейнеров")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.points, args.queries, args.k)
@@ -0,0 +1,144 @@
+import os
+import hmac
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from user_store import get_store
+
+# === Хэширование паролей ===
+# scrypt с солью и настраиваемой стоимостью. Проверка намеренно медленная,
+# поэтому выполняется в пуле потоков, а результат возвращается через
+# callback(результат, ошибка): ошибка - исключение (например, users.db занята
+# или повреждена) или None.
+# Старые записи (голый sha256 из users.txt) перехэшируются при следующем входе.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # scrypt занимает 128 * r * n байт памяти, стандартного лимита в 32 МБ может не хватить
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n, dklen=32)
+
+
+def hash_password(password: str, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P) -> str:
+    """Возвращает строку вида scrypt$n$r$p$<соль>$<хэш>"""
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, n, r, p)
+    return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def is_legacy(stored: str) -> bool:
+    """Старый формат: несолёный sha256 в hex"""
+    return not stored.startswith("scrypt$")
+
+
+def verify_password(password: str, stored: str, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Проверяет пароль; возвращает (подходит ли, нужно ли перехэшировать)"""
+    if not stored:
+        return False, False
+
+    if is_legacy(stored):
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, stored), True
+
+    try:
+        _, sn, sr, sp, salt, digest = stored.split("$")
+        sn, sr, sp = int(sn), int(sr), int(sp)
+        expected = bytes.fromhex(digest)
+        actual = _scrypt(password, bytes.fromhex(salt), sn, sr, sp)
+    except ValueError:
+        return False, False
+    return hmac.compare_digest(actual, expected), (sn, sr, sp) != (n, r, p)
+
+
+class CredentialService:
+    """Вход и регистрация в пуле потоков, callback вызывается в главном потоке"""
+
+    def __init__(self, store=None, workers=2, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, post=None):
+        self.store = store
+        self.params = (n, r, p)
+        self.post = post
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="credentials")
+
+    def _post(self, callback, *args):
+        if self.post is None:
+            from inference_queue import post_to_kivy
+            self.post = post_to_kivy
+        self.post(callback, *args)
+
+    def check(self, login: str, password: str) -> bool:
+        """Синхронная проверка (вызывать не из UI-потока)"""
+        store = self.store or get_store()
+        stored = store.get_password(login)
+        if stored is None:
+            # Считаем хэш и для несуществующего логина, чтобы время ответа не выдавало его
+            _scrypt(password, bytes(SALT_BYTES), *self.params)
+            return False
+
+        ok, needs_rehash = verify_password(password, stored, *self.params)
+        if ok and needs_rehash:
+            store.set_password(login, hash_password(password, *self.params))
+        return ok
+
+    def create(self, login: str, password: str) -> bool:
+        """Синхронная регистрация (вызывать не из UI-потока)"""
+        store = self.store or get_store()
+        return store.add(login, hash_password(password, *self.params))
+
+    def login(self, login: str, password: str, callback):
+        """Проверяет пароль в фоне; callback(ok, error) вызовется в главном потоке"""
+        return self._submit(self.check, login, password, callback)
+
+    def register(self, login: str, password: str, callback):
+        """Регистрирует пользователя в фоне; callback(created, error) вызовется в главном потоке"""
+        return self._submit(self.create, login, password, callback)
+
+    def _submit(self, fn, login, password, callback):
+        def done(future):
+            error = future.exception()
+            self._post(callback, False if error is not None else future.result(), error)
+        future = self._pool.submit(fn, login, password)
+        future.add_done_callback(done)
+        return future
+
+
+_service = None
+
+
+def get_service() -> CredentialService:
+    global _service
+    if _service is None:
+        _service = CredentialService()
+    return _service
+
+
+def benchmark(costs, logins=32, workers=4):
+    """Задержка одного входа и пропускная способность пула при разных n"""
+    print(f"{'n':>8} {'мс/вход':>10} {'входов/с':>10} (потоков: {workers})")
+    for n in costs:
+        stored = hash_password("secret", n=n)
+
+        start = time.perf_counter()
+        verify_password("secret", stored, n=n)
+        latency = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda _: verify_password("secret", stored, n=n), range(logins)))
+        throughput = logins / (time.perf_counter() - start)
+
+        print(f"{n:>8} {latency * 1000:>10.1f} {throughput:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк хэширования паролей")
+    parser.add_argument("--costs", type=int, nargs="+", default=[2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+    benchmark(args.costs, args.logins, args.workers)
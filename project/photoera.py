@@ -1,17 +1,12 @@
-from PIL import Image
+import sys
 
-# Путь к исходной фотографии
-input_path = "me1.jpg"  # замените на вашу фотку
-# Путь для сохранения сжатой фотографии
-output_path = "output_image_40x40.png"
+from avatars import SIZES, make_variants
 
-# Открываем изображение
-img = Image.open(input_path)
+# Путь к исходной фотографии (можно передать аргументом)
+input_path = sys.argv[1] if len(sys.argv) > 1 else "me1.jpg"  # замените на вашу фотку
 
-# Сжимаем до 40x40 с современным методом ресэмплинга
-img_resized = img.resize((400, 400), Image.Resampling.LANCZOS)
+# Готовим копии всех размеров, которые использует интерфейс, рядом со скриптом
+variants = make_variants(input_path, out_dir=".", sizes=SIZES)
 
-# Сохраняем
-img_resized.save(output_path)
-
-print(f"Фотка успешно сжата до 40x40 и сохранена как {output_path}")
+for size, output_path in sorted(variants.items()):
+    print(f"Фотка успешно сжата до {size}x{size} и сохранена как {output_path}")
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import zlib
+import threading
+from contextlib import contextmanager
+
+from file_lock import locked_file
+
+# === Журнал баллов (вместо перезаписи user_data.json) ===
+# Каждое начисление или списание - событие, дописываемое в конец файла.
+# Строка: "<crc32>\t<json>\n". События одной транзакции пишутся одной
+# записью с fsync, у последнего стоит "end": true. Если запись оборвалась
+# (сбой питания, падение), при открытии хвост с битой контрольной суммой или
+# незавершённой транзакцией отбрасывается. Текущие баллы каждого
+# пользователя держим в памяти, поэтому чтение баланса стоит O(1).
+# Один журнал могут открыть несколько приложений сразу (reg.py и test):
+# каждая транзакция идёт под блокировкой файла <журнал>.lock, а перед
+# проверкой баланса дочитываются события, которые дописали другие процессы.
+LEDGER_PATH = "points_ledger.log"
+LEGACY_FILE = "user_data.json"
+
+
+def encode_event(event: dict) -> bytes:
+    payload = json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"%08x\t%s\n" % (zlib.crc32(payload), payload)
+
+
+def decode_event(line: bytes):
+    """Событие из строки журнала или None, если строка повреждена"""
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b"\t":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+class Transaction:
+    """Набор событий, которые попадут в журнал вместе или не попадут вовсе"""
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.events = []
+        self._pending = {}  # user -> изменение баланса внутри транзакции
+
+    def balance(self, user) -> int:
+        return self.ledger.balance(user) + self._pending.get(user, 0)
+
+    def award(self, user: str, amount: int, reason=""):
+        """Начисляет баллы (идут и в баланс, и в общий счёт для рейтинга)"""
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+        self._add(user, amount, reason)
+
+    def spend(self, user: str, amount: int, reason="") -> bool:
+        """Списывает баллы; False, если их не хватает"""
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+        if self.balance(user) < amount:
+            return False
+        self._add(user, -amount, reason)
+        return True
+
+    def _add(self, user, delta, reason):
+        self.events.append({"user": user, "delta": delta, "reason": reason, "ts": round(time.time(), 3)})
+        self._pending[user] = self._pending.get(user, 0) + delta
+
+
+class PointsLedger:
+    """Баллы пользователей: журнал событий + индекс текущих сумм"""
+
+    def __init__(self, path=LEDGER_PATH, legacy_path=LEGACY_FILE):
+        self.path = path
+        self.recovered_bytes = 0  # сколько байт битого хвоста отброшено при открытии
+        self._lock = threading.RLock()
+        self._balances = {}
+        self._totals = {}
+        self._seq = 0
+        self._offset = 0  # до какого места журнал уже прочитан
+        self._listeners = []
+        self._lock_file = open(path + ".lock", "a+b")
+        self._lock_depth = 0
+
+        with self._exclusive():
+            self._file = open(path, "ab")
+            self._refresh(truncate=True)
+            if self._seq == 0 and legacy_path and os.path.exists(legacy_path):
+                self.migrate(legacy_path)
+
+    @contextmanager
+    def _exclusive(self):
+        """Блокировка и между потоками, и между процессами (повторный вход разрешён)"""
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with locked_file(self._lock_file):
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+
+    def _refresh(self, truncate=False):
+        """Дочитывает транзакции, дописанные после прошлого чтения (в том числе другими процессами).
+        truncate=True (только под _exclusive) обрезает недописанный хвост"""
+        with self._lock:
+            if os.path.getsize(self.path) == self._offset and not truncate:
+                return
+            good = offset = self._offset  # good - конец последней целиком записанной транзакции
+            batch = []
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    event = decode_event(line)
+                    if event is None:
+                        break
+                    offset += len(line)
+                    batch.append(event)
+                    if event.get("end"):
+                        for item in batch:
+                            self._apply(item)
+                        for listener in self._listeners:
+                            listener(batch)
+                        batch = []
+                        good = offset
+            self._offset = good
+            size = os.path.getsize(self.path)
+            if truncate and good != size:
+                self.recovered_bytes += size - good
+                with open(self.path, "r+b") as f:
+                    f.truncate(good)
+
+    def _apply(self, event):
+        user, delta = event["user"], event["delta"]
+        self._balances[user] = self._balances.get(user, 0) + delta
+        if delta > 0:
+            self._totals[user] = self._totals.get(user, 0) + delta
+        self._seq = max(self._seq, event["seq"])
+
+    def migrate(self, legacy_path=LEGACY_FILE) -> int:
+        """Одноразовый перенос баллов из user_data.json, возвращает число пользователей"""
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self.transaction() as tx:
+            for user, stats in data.items():
+                points = stats.get("points", 0)
+                total = max(points, stats.get("total_points", 0))
+                if total > 0:
+                    tx.award(user, total, "migrate")
+                if total > points:
+                    tx.spend(user, total - points, "migrate")
+        return len(data)
+
+    @contextmanager
+    def transaction(self):
+        """Все события внутри блока with записываются одним fsync или не записываются"""
+        with self._exclusive():
+            self._refresh(truncate=True)  # баланс проверяется по свежему журналу
+            tx = Transaction(self)
+            yield tx
+            self._commit(tx.events)
+
+    def _commit(self, events):
+        if not events:
+            return
+        for event in events:
+            self._seq += 1
+            event["seq"] = self._seq
+        events[-1]["end"] = True
+        data = b"".join(encode_event(event) for event in events)
+
+        start = self._file.seek(0, os.SEEK_END)
+        try:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError:
+            # Не оставляем полтранзакции: откатываем файл и номер события
+            self._file.truncate(start)
+            self._seq -= len(events)
+            raise
+        self._offset = start + len(data)
+
+        for event in events:
+            self._apply(event)
+        for listener in self._listeners:
+            listener(events)
+
+    def subscribe(self, listener):
+        """listener(events) вызывается после каждой записанной транзакции"""
+        self._listeners.append(listener)
+
+    def award(self, user: str, amount: int, reason="") -> int:
+        """Начисляет баллы и возвращает новый баланс"""
+        with self.transaction() as tx:
+            tx.award(user, amount, reason)
+        return self.balance(user)
+
+    def spend(self, user: str, amount: int, reason="") -> bool:
+        """Списывает баллы; False, если их не хватает"""
+        with self.transaction() as tx:
+            return tx.spend(user, amount, reason)
+
+    def balance(self, user: str) -> int:
+        """Баллы, которые можно потратить"""
+        self._refresh()
+        return self._balances.get(user, 0)
+
+    def total(self, user: str) -> int:
+        """Сколько баллов пользователь заработал за всё время"""
+        self._refresh()
+        return self._totals.get(user, 0)
+
+    def totals(self) -> dict:
+        """Копия индекса общих сумм (для рейтинга)"""
+        with self._lock:
+            self._refresh()
+            return dict(self._totals)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._lock_file.close()
+
+
+_ledger = None
+
+
+def get_ledger() -> PointsLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = PointsLedger()
+    return _ledger
+
+
+if __name__ == "__main__":
+    # python points_ledger.py [user_data.json] - перенести баллы и показать итог
+    legacy = sys.argv[1] if len(sys.argv) > 1 else LEGACY_FILE
+    ledger = PointsLedger(legacy_path=legacy)
+    if ledger.recovered_bytes:
+        print(f"Отброшен повреждённый хвост журнала: {ledger.recovered_bytes} байт")
+    for user, total in sorted(ledger.totals().items(), key=lambda item: -item[1]):
+        print(f"{user}: баланс {ledger.balance(user)}, всего {total}")
@@ -1,22 +1,31 @@
 import os
-import torch
-import clip
-from PIL import Image as PILImage
+
+from clip_model import needs_start
+from food_classifier import VERDICT_TEXT, get_classifier
+from inference_queue import InferenceService
+from tile_cache import get_tile_cache
+from tile_pack import get_map_source
+from marker_layer import ContainerLayer, load_containers
+from nearest import NearestContainers
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.screenmanager import ScreenManager, Screen, FadeTransition
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.image import Image
 from kivy.uix.relativelayout import RelativeLayout
-from kivy_garden.mapview import MapView, MapMarker
+from kivy_garden.mapview import MapView
 from kivy.uix.filechooser import FileChooserIconView, FileChooserListView
 from kivy.uix.dropdown import DropDown
 
 # === CLIP загрузка ===
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
+classifier = get_classifier()  # общий движок проверки еды или, с FOOD_SERVER, клиент сервера
+clip_provider = classifier.provider  # сама модель грузится в фоне, см. FoodScreen.on_enter
+VERDICTS = dict(VERDICT_TEXT, not_food="Это вообще не еда!")  # у этого приложения свой текст для "не еда"
+inference = InferenceService(name="food-check")  # проверки фото идут в фоновом потоке
+tile_cache = get_tile_cache()  # тайлы карты: лимит размера папки cache/
 
 
 class BaseScreen(Screen):
@@ -80,10 +89,15 @@ class MapScreen(BaseScreen):
         super().__init__(**kwargs)
         self.content.add_widget(Label(text="🗺 Карта контейнеров", font_size=22, bold=True))
 
-        self.map_view = MapView(zoom=14, lat=53.2835, lon=69.3969)
+        # если собран tiles.mbtiles (python tile_pack.py import), тайлы читаются из него
+        self.map_view = MapView(zoom=14, lat=53.2835, lon=69.3969, map_source=get_map_source())
+        tile_cache.start_cleanup()  # лимит размера кэша тайлов, в фоне
         self.content.add_widget(self.map_view)
 
         self.add_markers()
+        self.nearest_btn = Button(text="Ближайший контейнер", size_hint=(1, None), height=40,
+                                  background_color=(0.2, 0.6, 0.8, 1), on_press=self.show_nearest)
+        self.content.add_widget(self.nearest_btn)
 
         self.content.add_widget(Button(
             text="⬅ Назад",
@@ -92,15 +106,21 @@ class MapScreen(BaseScreen):
         ))
 
     def add_markers(self):
-        locations = [
-            {"lat": 53.2835, "lon": 69.3969, "icon": "cache/eco_bin_icon.jpg"},
-            {"lat": 53.2821, "lon": 69.3897, "icon": "cache/eco_bin_icon.jpg"},
-            {"lat": 53.2940, "lon": 69.4048, "icon": "cache/eco_bin_icon.jpg"},
-        ]
-
-        for loc in locations:
-            marker = MapMarker(lat=loc["lat"], lon=loc["lon"], source=loc["icon"])
-            self.map_view.add_widget(marker)
+        # Контейнеры из containers.csv; маркеры создаются только для видимой части карты
+        self.containers = load_containers()
+        self.container_layer = ContainerLayer(self.containers)
+        self.map_view.add_layer(self.container_layer)
+        self.nearest = NearestContainers(self.containers)
+
+    def show_nearest(self, instance):
+        """Центрирует карту на ближайшем к центру карты контейнере и выделяет три ближайших"""
+        found = self.nearest.nearest(self.map_view.lat, self.map_view.lon, k=3)
+        if not found:
+            return
+        distance, first = found[0]
+        self.container_layer.highlight([i for _, i in found])
+        self.map_view.center_on(self.containers[first]["lat"], self.containers[first]["lon"])
+        self.nearest_btn.text = f"Ближайший контейнер: {distance:.0f} м"
 
     def go_back(self, instance):
         self.manager.current = "main"
@@ -145,6 +165,32 @@ class FoodScreen(BaseScreen):
         )
         self.content.add_widget(self.back_btn)
 
+    def on_enter(self, *args):
+        """Прогреваем CLIP при первом заходе на экран"""
+        if needs_start(clip_provider):  # в том числе повторно после ошибки
+            self.upload_btn.disabled = True
+            self.result_label.text = "Модель прогревается, подождите..."
+            clip_provider.start(lambda provider: Clock.schedule_once(self.on_model_ready))
+
+    def on_model_ready(self, dt):
+        """Модель загружена (вызывается в главном потоке)"""
+        self.upload_btn.disabled = False  # и после ошибки: выбор фото загрузит модель заново
+        if clip_provider.error is not None:
+            self.result_label.text = f"Не удалось загрузить модель: {clip_provider.error}\nВыберите фото, чтобы попробовать снова"
+            return
+        self.result_label.text = f"Модель готова (загрузка {clip_provider.metrics['total_seconds']:.1f} с)"
+
+    def on_leave(self, *args):
+        """Уходим с экрана - незавершённые проверки больше не нужны"""
+        inference.cancel(self)
+
+    def show_result(self, result, error):
+        """Результат проверки из фонового потока (вызывается в главном потоке)"""
+        if error is not None:
+            self.result_label.text = f"Не удалось проверить фото: {error}"
+        else:
+            self.result_label.text = result
+
     def open_filechooser(self, instance):
         """Открывает диалог выбора файла с доступом к Рабочему столу и Загрузкам"""
         self.content.clear_widgets()
@@ -198,7 +244,8 @@ class FoodScreen(BaseScreen):
         if selection:
             file_path = selection[0]
             self.food_img.source = file_path
-            self.analyze_image(file_path)
+            self.result_label.text = "Проверяем фото..."
+            inference.submit(file_path, lambda: self.analyze_image(file_path), self.show_result, owner=self)
             self.reset_ui()
 
     def reset_ui(self):
@@ -211,36 +258,8 @@ class FoodScreen(BaseScreen):
         self.content.add_widget(self.back_btn)
 
     def analyze_image(self, file_path):
-        image = preprocess(PILImage.open(file_path)).unsqueeze(0).to(device)
-
-        text_descriptions = [
-            "not food",
-            "fresh food",
-            "edible food",
-            "tasty food",
-            "rotten food",
-            "food with mold"
-        ]
-        text_tokens = clip.tokenize(text_descriptions).to(device)
-
-        with torch.no_grad():
-            image_features = model.encode_image(image)
-            text_features = model.encode_text(text_tokens)
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            similarity = (image_features @ text_features.T).squeeze(0)
-
-        best_idx = similarity.argmax().item()
-        best_label = text_descriptions[best_idx]
-
-        if "fresh" in best_label or "edible" in best_label or "tasty" in best_label:
-            result_text = "Эту еду можно есть!"
-        elif "rotten" in best_label or "mold" in best_label:
-            result_text = "Эту еду есть нельзя!"
-        else:
-            result_text = "Это вообще не еда!"
-
-        self.result_label.text = f"CLIP считает: {best_label}\n\n{result_text}"
+        """Проверка еды через CLIP (выполняется в фоновом потоке, UI не трогает)"""
+        return classifier.classify(file_path).describe(VERDICTS)
 
     def go_back(self, instance):
         self.manager.current = "main"
@@ -1,10 +1,18 @@
-import os
-import torch
-import clip
-import hashlib
-from PIL import Image as PILImage
+from passwords import get_service
+from clip_model import needs_start
+from food_classifier import get_classifier
+from dup_index import duplicate_note
+from inference_queue import InferenceService
+from tile_cache import get_tile_cache
+from tile_pack import get_map_source
+from marker_layer import ContainerLayer, load_containers
+from nearest import NearestContainers
+from assets import get_assets, image_widget
+from avatars import best_variant
+from points_ledger import get_ledger
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.screenmanager import ScreenManager, Screen, FadeTransition
 from kivy.uix.label import Label
 from kivy.uix.button import Button
@@ -12,12 +20,16 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.image import Image
 from kivy.uix.textinput import TextInput
 from kivy.uix.relativelayout import RelativeLayout
-from kivy_garden.mapview import MapView, MapMarker
+from kivy_garden.mapview import MapView
 from kivy.uix.filechooser import FileChooserIconView
 
 # === Загружаем CLIP-модель для анализа изображений ===
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
+classifier = get_classifier()  # общий движок проверки еды или, с FOOD_SERVER, клиент сервера
+clip_provider = classifier.provider  # сама модель грузится в фоне, см. FoodScreen.on_enter
+inference = InferenceService(name="food-check")  # проверки фото идут в фоновом потоке
+tile_cache = get_tile_cache()  # тайлы карты: лимит размера папки cache/
+credentials = get_service()  # пароли проверяются в фоновом пуле потоков
+ledger = get_ledger()  # баллы: журнал событий + индекс сумм в памяти
 
 # === Глобальная переменная текущего пользователя ===
 current_user = {
@@ -26,38 +38,6 @@ current_user = {
     "points": 0
 }
 
-# === Работа с пользователями (регистрация и вход) ===
-def init_file():
-    """Создаёт файл users.txt, если его нет"""
-    if not os.path.exists('users.txt'):
-        with open('users.txt', 'w'):
-            pass
-
-def add_user(login: str, password: str) -> bool:
-    """Добавляет пользователя в файл"""
-    with open('users.txt', 'r') as f:
-        users = f.read().splitlines()
-
-    for user in users:
-        args = user.split(':')
-        if login == args[0]:
-            return False
-    with open('users.txt', 'a') as f:
-        f.write(f'{login}:{password}\n')
-    return True
-
-def get_user(login: str, password: str) -> bool:
-    """Проверяет логин и пароль пользователя"""
-    with open('users.txt', 'r') as f:
-        users = f.read().splitlines()
-    for user in users:
-        args = user.split(':')
-        if login == args[0] and password == args[1]:
-            return True
-    return False
-
-init_file()
-
 # === Базовый экран с фоном ===
 class BaseScreen(Screen):
     def __init__(self, **kwargs):
@@ -109,12 +89,19 @@ class AuthScreen(BaseScreen):
     def login(self, instance):
         """Вход"""
         login = self.login_input.text.strip()
-        password = hashlib.sha256(self.password_input.text.strip().encode()).hexdigest()
-
-        if get_user(login, password):
+        password = self.password_input.text.strip()
+        self.message.text = "Проверяем..."
+        credentials.login(login, password, lambda ok, error: self.on_login(login, ok, error))
+
+    def on_login(self, login, ok, error=None):
+        """Результат проверки пароля (вызывается в главном потоке)"""
+        self.message.text = ""
+        if error is not None:
+            self.message.text = f"Ошибка базы пользователей: {error}"
+        elif ok:
             global current_user
             current_user["login"] = login
-            current_user["points"] = 0
+            current_user["points"] = ledger.balance(login)
             self.manager.current = "main"
         else:
             self.message.text = "Неверный логин или пароль!"
@@ -128,8 +115,14 @@ class AuthScreen(BaseScreen):
             self.message.text = "Введите логин и пароль!"
             return
 
-        password_hashed = hashlib.sha256(password.encode()).hexdigest()
-        if add_user(login, password_hashed):
+        self.message.text = "Регистрируем..."
+        credentials.register(login, password, self.on_register)
+
+    def on_register(self, created, error=None):
+        """Результат регистрации (вызывается в главном потоке)"""
+        if error is not None:
+            self.message.text = f"Ошибка базы пользователей: {error}"
+        elif created:
             self.message.text = "Регистрация успешна! Теперь войдите."
         else:
             self.message.text = "Пользователь уже существует!"
@@ -147,7 +140,7 @@ class MainScreen(BaseScreen):
         self.profile_layout = BoxLayout(orientation="horizontal", spacing=10,
                                         size_hint=(None, None), height=60, width=250,
                                         pos_hint={"right": 0.98, "top": 0.98})
-        self.avatar = Image(source=current_user["avatar"], size_hint=(None, None), size=(50, 50))
+        self.avatar = image_widget(best_variant(current_user["avatar"], 50), (50, 50))
         self.user_info = Label(text=f"{current_user['login']}\nБаллы: {current_user['points']}",
                                color=(1, 1, 1, 1), font_size=14, halign="left", valign="middle")
         self.profile_layout.add_widget(self.avatar)
@@ -167,8 +160,9 @@ class MainScreen(BaseScreen):
 
     def on_pre_enter(self, *args):
         """Обновляем данные профиля при заходе на экран"""
+        current_user["points"] = ledger.balance(current_user["login"])
         self.user_info.text = f"{current_user['login']}\nБаллы: {current_user['points']}"
-        self.avatar.source = current_user["avatar"]
+        self.avatar.texture = get_assets().texture(best_variant(current_user["avatar"], 50), (50, 50))
 
     def go_to_map(self, instance):
         self.manager.current = "map"
@@ -182,22 +176,34 @@ class MapScreen(BaseScreen):
         super().__init__(**kwargs)
         self.content.add_widget(Label(text="Карта контейнеров", font_size=22, bold=True))
 
-        self.map_view = MapView(zoom=14, lat=53.2835, lon=69.3969)
+        # если собран tiles.mbtiles (python tile_pack.py import), тайлы читаются из него
+        self.map_view = MapView(zoom=14, lat=53.2835, lon=69.3969, map_source=get_map_source())
+        tile_cache.start_cleanup()  # лимит размера кэша тайлов, в фоне
         self.content.add_widget(self.map_view)
         self.add_markers()
+        self.nearest_btn = Button(text="Ближайший контейнер", size_hint=(1, None), height=40,
+                                  background_color=(0.2, 0.6, 0.8, 1), on_press=self.show_nearest)
+        self.content.add_widget(self.nearest_btn)
 
         self.content.add_widget(Button(text="Назад", background_color=(0.2, 0.6, 0.2, 1),
                                        on_press=self.go_back))
 
     def add_markers(self):
-        locations = [
-            {"lat": 53.2835, "lon": 69.3969, "icon": "cache/eco_bin_icon.jpg"},
-            {"lat": 53.2821, "lon": 69.3897, "icon": "cache/eco_bin_icon.jpg"},
-            {"lat": 53.2940, "lon": 69.4048, "icon": "cache/eco_bin_icon.jpg"},
-        ]
-        for loc in locations:
-            marker = MapMarker(lat=loc["lat"], lon=loc["lon"], source=loc["icon"])
-            self.map_view.add_widget(marker)
+        # Контейнеры из containers.csv; маркеры создаются только для видимой части карты
+        self.containers = load_containers()
+        self.container_layer = ContainerLayer(self.containers)
+        self.map_view.add_layer(self.container_layer)
+        self.nearest = NearestContainers(self.containers)
+
+    def show_nearest(self, instance):
+        """Центрирует карту на ближайшем к центру карты контейнере и выделяет три ближайших"""
+        found = self.nearest.nearest(self.map_view.lat, self.map_view.lon, k=3)
+        if not found:
+            return
+        distance, first = found[0]
+        self.container_layer.highlight([i for _, i in found])
+        self.map_view.center_on(self.containers[first]["lat"], self.containers[first]["lon"])
+        self.nearest_btn.text = f"Ближайший контейнер: {distance:.0f} м"
 
     def go_back(self, instance):
         self.manager.current = "main"
@@ -223,6 +229,32 @@ class FoodScreen(BaseScreen):
         self.back_btn = Button(text="Назад", background_color=(0.2, 0.6, 0.2, 1), on_press=self.go_back)
         self.content.add_widget(self.back_btn)
 
+    def on_enter(self, *args):
+        """Прогреваем CLIP при первом заходе на экран"""
+        if needs_start(clip_provider):  # в том числе повторно после ошибки
+            self.upload_btn.disabled = True
+            self.result_label.text = "Модель прогревается, подождите..."
+            clip_provider.start(lambda provider: Clock.schedule_once(self.on_model_ready))
+
+    def on_model_ready(self, dt):
+        """Модель загружена (вызывается в главном потоке)"""
+        self.upload_btn.disabled = False  # и после ошибки: выбор фото загрузит модель заново
+        if clip_provider.error is not None:
+            self.result_label.text = f"Не удалось загрузить модель: {clip_provider.error}\nВыберите фото, чтобы попробовать снова"
+            return
+        self.result_label.text = f"Модель готова (загрузка {clip_provider.metrics['total_seconds']:.1f} с)"
+
+    def on_leave(self, *args):
+        """Уходим с экрана - незавершённые проверки больше не нужны"""
+        inference.cancel(self)
+
+    def show_result(self, result, error):
+        """Результат проверки из фонового потока (вызывается в главном потоке)"""
+        if error is not None:
+            self.result_label.text = f"Не удалось проверить фото: {error}"
+        else:
+            self.result_label.text = result
+
     def open_filechooser(self, instance):
         self.content.clear_widgets()
         self.content.add_widget(Label(text="Выберите фото", font_size=20, bold=True))
@@ -244,7 +276,8 @@ class FoodScreen(BaseScreen):
         if selection:
             file_path = selection[0]
             self.food_img.source = file_path
-            self.analyze_image(file_path)
+            self.result_label.text = "Проверяем фото..."
+            inference.submit(file_path, lambda: self.analyze_image(file_path), self.show_result, owner=self)
             self.reset_ui()
 
     def reset_ui(self):
@@ -256,28 +289,10 @@ class FoodScreen(BaseScreen):
         self.content.add_widget(self.back_btn)
 
     def analyze_image(self, file_path):
-        image = preprocess(PILImage.open(file_path)).unsqueeze(0).to(device)
-        text_descriptions = ["not food", "fresh food", "edible food", "tasty food", "rotten food", "food with mold"]
-        text_tokens = clip.tokenize(text_descriptions).to(device)
-
-        with torch.no_grad():
-            image_features = model.encode_image(image)
-            text_features = model.encode_text(text_tokens)
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            similarity = (image_features @ text_features.T).squeeze(0)
-
-        best_idx = similarity.argmax().item()
-        best_label = text_descriptions[best_idx]
-
-        if "fresh" in best_label or "edible" in best_label or "tasty" in best_label:
-            result_text = "Эту еду можно есть!"
-        elif "rotten" in best_label or "mold" in best_label:
-            result_text = "Эту еду есть нельзя!"
-        else:
-            result_text = "Это не еда!"
-
-        self.result_label.text = f"CLIP считает: {best_label}\n\n{result_text}"
+        """Проверка еды через CLIP (выполняется в фоновом потоке, UI не трогает)"""
+        result = classifier.classify(file_path).describe()
+        # Повторно отправленные фото (в том числе пережатые или обрезанные) - по истории эмбеддингов
+        return result + duplicate_note(classifier, file_path, current_user["login"])
 
     def go_back(self, instance):
         self.manager.current = "main"
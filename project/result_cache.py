@@ -0,0 +1,226 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+# === Кэш результатов проверки по содержимому фото ===
+# Ключ - sha256 байтов картинки + модель (+ набор подсказок для оценок).
+# Храним нормированный эмбеддинг картинки, поэтому при смене подсказок
+# заново считается только умножение на новые текстовые эмбеддинги.
+# Попадания не пишут в базу сразу: время использования копится в памяти и
+# уходит одним UPDATE при следующей записи, каждые TOUCH_BATCH попаданий и
+# при закрытии. При падении процесса теряется только порядок вытеснения.
+CACHE_DIR = "clip_cache"
+DB_PATH = os.path.join(CACHE_DIR, "results.db")
+MAX_BYTES = 64 * 1024 * 1024  # ~30 тысяч эмбеддингов ViT-B/32
+TOUCH_BATCH = 256             # попаданий до записи времени использования в базу
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def prompts_hash(prompts) -> str:
+    return hashlib.sha256("\0".join(prompts).encode()).hexdigest()[:32]
+
+
+def _pack(values) -> bytes:
+    return array("f", values).tobytes()
+
+
+def _unpack(blob) -> list:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class ResultCache:
+    """SQLite-кэш эмбеддингов и оценок с вытеснением давно неиспользованных записей"""
+
+    def __init__(self, path=DB_PATH, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "embedding_hits": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._touched = {}  # (хэш, модель) -> время попадания, ещё не записанное в базу
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                image_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (image_hash, model)
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_used);
+            CREATE TABLE IF NOT EXISTS scores (
+                image_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompts TEXT NOT NULL,
+                scores BLOB NOT NULL,
+                PRIMARY KEY (image_hash, model, prompts)
+            );
+        """)
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_embedding(self, image_hash, model):
+        """Нормированный эмбеддинг картинки или None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT vector FROM embeddings WHERE image_hash = ? AND model = ?",
+                (image_hash, model)).fetchone()
+            if row is None:
+                return None
+            self._touch(image_hash, model)
+            return _unpack(row[0])
+
+    def get_scores(self, image_hash, model, prompts):
+        """Сохранённый вектор сходства для набора подсказок или None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT scores FROM scores WHERE image_hash = ? AND model = ? AND prompts = ?",
+                (image_hash, model, prompts_hash(prompts))).fetchone()
+            if row is None:
+                return None
+            self._touch(image_hash, model)
+            return _unpack(row[0])
+
+    def put(self, image_hash, model, embedding, prompts=None, scores=None):
+        """Сохраняет эмбеддинг (и, если есть, оценки) и при необходимости чистит кэш"""
+        blob = _pack(embedding)
+        with self._lock:
+            self._flush_touched()  # вытеснение ниже должно видеть свежие попадания
+            old = self._db.execute(
+                "SELECT size FROM embeddings WHERE image_hash = ? AND model = ?",
+                (image_hash, model)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)",
+                (image_hash, model, blob, len(blob), time.time()))
+            self._total += len(blob) - (old[0] if old else 0)
+            if scores is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                    (image_hash, model, prompts_hash(prompts), _pack(scores)))
+            if self._total > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _touch(self, image_hash, model):
+        self._touched[(image_hash, model)] = time.time()
+        if len(self._touched) >= TOUCH_BATCH:
+            self._flush_touched()
+            self._db.commit()
+
+    def _flush_touched(self):
+        """Записывает накопленные попадания одним запросом (коммит - у вызывающего)"""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE image_hash = ? AND model = ?",
+                [(used, image_hash, model) for (image_hash, model), used in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        """Удаляет самые старые записи, пока размер не станет ~90% от лимита"""
+        target = self.max_bytes * 0.9
+        rows = self._db.execute(
+            "SELECT image_hash, model, size FROM embeddings ORDER BY last_used").fetchall()
+        for image_hash, model, size in rows:
+            if self._total <= target:
+                break
+            self._db.execute("DELETE FROM embeddings WHERE image_hash = ? AND model = ?", (image_hash, model))
+            self._db.execute("DELETE FROM scores WHERE image_hash = ? AND model = ?", (image_hash, model))
+            self._total -= size
+            self.stats["evicted"] += 1
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResultCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+
+def read_source(source) -> bytes:
+    """Байты фото по пути (или сами байты)"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def cached_scores(file_path, prompts, provider, cache=None, backend=None):
+    """Сходство фото (путь или байты) с подсказками: кэш оценок -> кэш эмбеддинга -> CLIP"""
+    return cached_scores_batch([file_path], prompts, provider, cache, backend)[0]
+
+
+def cached_scores_batch(sources, prompts, provider, cache=None, backend=None) -> list:
+    """То же для нескольких фото: всё, чего нет в кэше, кодируется одной пачкой"""
+    import torch
+    from backends import get_encoder, model_id as backend_model_id
+    from fast_decode import input_size, load_tensor
+    from text_cache import get_text_features
+
+    cache = cache or get_cache()
+    model_id = backend_model_id(provider.model_name, backend)
+    results = [None] * len(sources)
+    todo = []  # (номер, хэш, байты) - фото без готовых оценок
+    for i, source in enumerate(sources):
+        data = read_source(source)
+        image_hash = content_hash(data)
+        scores = cache.get_scores(image_hash, model_id, prompts)
+        if scores is not None:
+            cache.stats["hits"] += 1
+            results[i] = torch.tensor(scores)
+        else:
+            todo.append((i, image_hash, data))
+    if not todo:
+        return results
+
+    model, _, device = provider.get()
+    text_features = get_text_features(model, prompts, provider.model_name, device)
+
+    features = {}
+    keys = {}  # номер -> ключ кэша, под которым сохранять (после отката бэкенда он другой)
+    missing = []
+    for i, image_hash, data in todo:
+        embedding = cache.get_embedding(image_hash, model_id)
+        if embedding is not None:
+            cache.stats["embedding_hits"] += 1
+            features[i] = torch.tensor(embedding, dtype=text_features.dtype, device=device)
+            keys[i] = model_id
+        else:
+            cache.stats["misses"] += 1
+            missing.append((i, data))
+    if missing:
+        size = input_size(model)
+        batch = torch.stack([load_tensor(data, size) for _, data in missing])
+        encoder = get_encoder(provider, backend)
+        encoded = encoder.encode(batch).to(device, text_features.dtype)
+        encoded_id = backend_model_id(provider.model_name, backend, encoder)
+        for (i, _), row in zip(missing, encoded):
+            features[i] = row
+            keys[i] = encoded_id
+
+    for i, image_hash, _ in todo:
+        similarity = (features[i] @ text_features.T).float().cpu()
+        cache.put(image_hash, keys[i], features[i].float().cpu().tolist(), prompts, similarity.tolist())
+        results[i] = similarity
+    return results
@@ -0,0 +1,74 @@
+import os
+import hashlib
+
+import torch
+import clip
+
+# === Кэш текстовых эмбеддингов CLIP ===
+# Набор подсказок для проверки еды не меняется, поэтому считаем их эмбеддинги
+# один раз, держим в памяти и сохраняем на диск рядом с проектом.
+CACHE_DIR = "clip_cache"
+
+_memory_cache = {}
+_weights_hashes = {}
+
+
+def weights_hash(model_name: str) -> str:
+    """Хэш весов модели (для стандартных моделей CLIP он уже есть в URL)"""
+    if model_name in _weights_hashes:
+        return _weights_hashes[model_name]
+
+    from clip.clip import _MODELS
+
+    if model_name in _MODELS:
+        # URL вида .../models/<sha256>/ViT-B-32.pt
+        digest = _MODELS[model_name].split("/")[-2]
+    elif os.path.isfile(model_name):
+        h = hashlib.sha256()
+        with open(model_name, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+    else:
+        digest = hashlib.sha256(model_name.encode()).hexdigest()
+
+    _weights_hashes[model_name] = digest
+    return digest
+
+
+def cache_key(model_name: str, prompts) -> str:
+    """Ключ кэша: хэш весов модели + список подсказок"""
+    h = hashlib.sha256(weights_hash(model_name).encode())
+    for prompt in prompts:
+        h.update(b"\0" + prompt.encode())
+    return h.hexdigest()[:32]
+
+
+def get_text_features(model, prompts, model_name="ViT-B/32", device="cpu"):
+    """Возвращает нормированные эмбеддинги подсказок (память -> диск -> модель)"""
+    prompts = tuple(prompts)
+    mem_key = (model_name, prompts, str(device))
+    if mem_key in _memory_cache:
+        return _memory_cache[mem_key]
+
+    path = os.path.join(CACHE_DIR, f"text_{cache_key(model_name, prompts)}.pt")
+    text_features = None
+    if os.path.exists(path):
+        try:
+            text_features = torch.load(path, map_location=device)
+        except Exception:
+            text_features = None  # битый файл - просто пересчитаем
+
+    if text_features is None:
+        text_tokens = clip.tokenize(list(prompts)).to(device)
+        with torch.no_grad():
+            text_features = model.encode_text(text_tokens)
+            text_features /= text_features.norm(dim=-1, keepdim=True)
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        torch.save(text_features.cpu(), tmp_path)
+        os.replace(tmp_path, path)
+
+    _memory_cache[mem_key] = text_features
+    return text_features
@@ -0,0 +1,322 @@
+import os
+import re
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# === Кэш тайлов карты ===
+# MapView сам складывает тайлы в cache/ как <ключ>_<zoom>_<x>_<y>.png и
+# никогда их не удаляет. TileCache следит за общим размером и удаляет самые
+# старые тайлы (FIFO по времени записи). Читает тайлы MapView сам, мимо
+# TileCache, поэтому чтения видны только по atime при сканировании папки -
+# там, где файловая система его обновляет (relatime - не чаще раза в сутки).
+# Тайлы города можно скачать заранее командой `python tile_cache.py prefetch
+# --source ...`, чтобы при прокрутке карты они уже лежали на диске. Правила tile.openstreetmap.org запрещают массовую
+# загрузку, поэтому prefetch с него отказывается: нужен свой тайловый
+# сервер, провайдер, разрешающий такую загрузку, или папка с выгрузкой.
+# Запросы к серверу идут не чаще PREFETCH_RATE в секунду. Если тайлы уже
+# собраны в tiles.mbtiles (tile_pack.py), prefetch не качает то, что есть в
+# пакете, а новые тайлы дописывает в пакет, а не россыпью в cache/.
+# В именах файлов MapView номер строки y считается снизу (как в TMS),
+# а тайловые серверы ждут y сверху (XYZ) - см. tms_row().
+CACHE_DIR = "cache"
+MAX_BYTES = 200 * 1024 * 1024
+
+OSM_URL = "http://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
+OSM_SUBDOMAINS = "abc"
+OSM_HOST = "tile.openstreetmap.org"
+USER_AGENT = "MiskaDobra/1.0 (tile prefetch)"  # OSM отклоняет запросы без User-Agent
+
+CITY_CENTER = (53.2835, 69.3969)
+CITY_BBOX = (53.24, 69.32, 53.33, 69.47)  # lat_min, lon_min, lat_max, lon_max
+PREFETCH_ZOOMS = (12, 15)                 # MapView открывается на zoom=14
+PREFETCH_RATE = 2.0                       # тайлов в секунду с одного сервера
+PACK_BATCH = 500                          # тайлов на транзакцию при записи в пакет
+
+TILE_NAME = re.compile(r"^([0-9a-f]{10})_(\d+)_(\d+)_(\d+)\.png$")
+
+
+def source_key(url=OSM_URL) -> str:
+    """Префикс имён файлов, который MapView даёт источнику с этим url"""
+    return hashlib.sha224(url.encode("utf8")).hexdigest()[:10]
+
+
+def deg2tile(lat, lon, zoom):
+    """Номер тайла (x, y) в схеме XYZ"""
+    n = 2 ** zoom
+    lat_rad = math.radians(lat)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tms_row(y, zoom):
+    """Переводит y между XYZ и нумерацией MapView (в обе стороны)"""
+    return 2 ** zoom - 1 - y
+
+
+def tiles_in_bbox(bbox, zoom):
+    """Все тайлы (x, y в XYZ), покрывающие прямоугольник"""
+    lat_min, lon_min, lat_max, lon_max = bbox
+    x0, y0 = deg2tile(lat_max, lon_min, zoom)
+    x1, y1 = deg2tile(lat_min, lon_max, zoom)
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            yield x, y
+
+
+# === Источники тайлов ===
+class HttpTileSource:
+    """Тайлы с тайлового сервера (по умолчанию OpenStreetMap)"""
+
+    def __init__(self, url=OSM_URL, subdomains=OSM_SUBDOMAINS, timeout=10, key=None):
+        self.url = url
+        self.subdomains = subdomains
+        self.timeout = timeout
+        self.key = key or source_key(url)  # key=source_key(OSM_URL) - класть под именами, которые ищет MapView
+        self.bulk_allowed = OSM_HOST not in url
+
+    def get(self, zoom, x, y):
+        """Байты PNG или None, если тайла нет"""
+        url = self.url.format(s=random.choice(self.subdomains), z=zoom, x=x, y=y)
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except OSError:
+            return None
+
+
+class DirectoryTileSource:
+    """Тайлы из локальной папки вида <root>/<z>/<x>/<y>.png (офлайн и для проверок)"""
+
+    bulk_allowed = True
+
+    def __init__(self, root, key=None):
+        self.root = root
+        self.key = key or source_key()
+
+    def get(self, zoom, x, y):
+        path = os.path.join(self.root, str(zoom), str(x), f"{y}.png")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class TileCache:
+    """Папка с тайлами MapView с ограничением по размеру (вытесняются самые старые, FIFO)"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, scan=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {"fetched": 0, "skipped": 0, "failed": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._files = {}  # имя файла -> (размер, время записи или последнего чтения по atime)
+        self._total = 0
+        self._thread = None
+        os.makedirs(cache_dir, exist_ok=True)
+        if scan:  # иначе папку просканирует фоновый поток, см. start_background
+            self._scan()
+
+    def _scan(self):
+        """Собирает тайлы с диска; время использования - atime или mtime, что позже"""
+        files = {}
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and TILE_NAME.match(entry.name):
+                    st = entry.stat()
+                    files[entry.name] = (st.st_size, max(st.st_atime, st.st_mtime))
+        with self._lock:
+            self._files = files
+            self._total = sum(size for size, _ in files.values())
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def __len__(self):
+        return len(self._files)
+
+    def filename(self, key, zoom, x, y):
+        """Имя файла тайла так, как его ищет MapView (y - в схеме XYZ)"""
+        return f"{key}_{zoom}_{x}_{tms_row(y, zoom)}.png"
+
+    def has(self, key, zoom, x, y) -> bool:
+        return self.filename(key, zoom, x, y) in self._files
+
+    def put(self, key, zoom, x, y, data: bytes):
+        """Атомарно кладёт тайл в папку (MapView не увидит недописанный файл)"""
+        name = self.filename(key, zoom, x, y)
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._files.get(name)
+            self._files[name] = (len(data), time.time())
+            self._total += len(data) - (old[0] if old else 0)
+        if self._total > self.max_bytes:
+            self.enforce()
+
+    def enforce(self) -> int:
+        """Удаляет самые старые тайлы, пока размер не станет ~90% от лимита"""
+        evicted = 0
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return 0
+            target = self.max_bytes * 0.9
+            for name, (size, _) in sorted(self._files.items(), key=lambda item: item[1][1]):
+                if self._total <= target:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                del self._files[name]
+                self._total -= size
+                evicted += 1
+        self.stats["evicted"] += evicted
+        return evicted
+
+    def prefetch(self, source, bbox=CITY_BBOX, zooms=PREFETCH_ZOOMS, workers=2, progress=None,
+                 rate=PREFETCH_RATE, pack=None):
+        """Скачивает недостающие тайлы прямоугольника для zoom от zooms[0] до zooms[1];
+        rate - не больше стольких запросов в секунду (0 - без ограничения),
+        pack - TilePack: тайлы из него не качаются, новые пишутся в него"""
+        if not getattr(source, "bulk_allowed", False):
+            raise ValueError(f"{OSM_HOST} запрещает массовую загрузку тайлов, укажите другой источник")
+        wanted = [(zoom, x, y)
+                  for zoom in range(zooms[0], zooms[1] + 1)
+                  for x, y in tiles_in_bbox(bbox, zoom)]
+        missing = [tile for tile in wanted if not self.has(source.key, *tile)]
+        if pack is not None:
+            missing = [(zoom, x, y) for zoom, x, y in missing if not pack.has(zoom, x, tms_row(y, zoom))]
+        self.stats["skipped"] += len(wanted) - len(missing)
+
+        interval = 1.0 / rate if rate else 0.0
+        next_at = [time.monotonic()]
+        rate_lock = threading.Lock()
+
+        def fetch(tile):
+            if interval:
+                with rate_lock:
+                    wait = next_at[0] - time.monotonic()
+                    next_at[0] = max(next_at[0], time.monotonic()) + interval
+                if wait > 0:
+                    time.sleep(wait)
+            data = source.get(*tile)
+            if data is None:
+                self.stats["failed"] += 1
+                return None
+            if pack is not None:
+                return tile, data  # в пакет пишет основной поток, пачками
+            self.put(source.key, *tile, data)
+            self.stats["fetched"] += 1
+            return None
+
+        batch = []
+
+        def flush():
+            pack.put_many(batch)
+            self.stats["fetched"] += len(batch)
+            batch.clear()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile-prefetch") as pool:
+            for done, result in enumerate(pool.map(fetch, missing), start=1):
+                if result is not None:
+                    (zoom, x, y), data = result
+                    batch.append((zoom, x, tms_row(y, zoom), data))
+                    if len(batch) >= PACK_BATCH:
+                        flush()
+                if progress is not None:
+                    progress(done, len(missing))
+        if batch:
+            flush()
+        return self.stats
+
+    def start_cleanup(self):
+        """Сканирование папки и чистка в фоновом потоке, интерфейс не ждёт диска"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            self._scan()
+            self.enforce()
+
+        self._thread = threading.Thread(target=run, name="tile-cache", daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+_cache = None
+
+
+def get_tile_cache() -> TileCache:
+    global _cache
+    if _cache is None:
+        _cache = TileCache(scan=False)
+    return _cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш тайлов карты")
+    parser.add_argument("--dir", default=CACHE_DIR)
+    parser.add_argument("--max-mb", type=float, default=MAX_BYTES / 1024 / 1024)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("stats", help="размер кэша")
+    sub.add_parser("evict", help="удалить лишнее сверх лимита")
+
+    prefetch = sub.add_parser("prefetch", help="заранее скачать тайлы города (не с tile.openstreetmap.org)")
+    prefetch.add_argument("--zooms", type=int, nargs=2, default=list(PREFETCH_ZOOMS))
+    prefetch.add_argument("--bbox", type=float, nargs=4, default=list(CITY_BBOX),
+                          metavar=("LAT_MIN", "LON_MIN", "LAT_MAX", "LON_MAX"))
+    prefetch.add_argument("--source", required=True,
+                          help="url тайлового сервера, разрешающего массовую загрузку ({z}/{x}/{y}), "
+                               "или папка вида <z>/<x>/<y>.png")
+    prefetch.add_argument("--map-url", default=OSM_URL,
+                          help="url, под которым MapView ищет тайлы (по умолчанию OSM)")
+    prefetch.add_argument("--workers", type=int, default=2)
+    prefetch.add_argument("--rate", type=float, default=PREFETCH_RATE, help="запросов в секунду, 0 - без ограничения")
+    prefetch.add_argument("--pack", default="tiles.mbtiles",
+                          help="пакет тайлов: если он есть, тайлы дописываются в него (см. tile_pack.py)")
+
+    args = parser.parse_args()
+    cache = TileCache(args.dir, int(args.max_mb * 1024 * 1024))
+
+    if args.command == "evict":
+        print(f"Удалено тайлов: {cache.enforce()}")
+    elif args.command == "prefetch":
+        if os.path.isdir(args.source):
+            source, rate = DirectoryTileSource(args.source, source_key(args.map_url)), 0
+        else:
+            source, rate = HttpTileSource(args.source, key=source_key(args.map_url)), args.rate
+        if not source.bulk_allowed:
+            parser.error(f"{OSM_HOST} запрещает массовую загрузку тайлов, укажите другой --source")
+
+        def progress(done, total):
+            print(f"\r{done}/{total}", end="", flush=True)
+
+        pack = None
+        if os.path.exists(args.pack) and source.key == source_key():
+            from tile_pack import TilePack  # пакет хранит только тайлы OSM, как и import_cache
+
+            pack = TilePack(args.pack)
+            print(f"Тайлы дописываются в {args.pack}")
+        start = time.perf_counter()
+        stats = cache.prefetch(source, tuple(args.bbox), tuple(args.zooms), args.workers, progress, rate, pack)
+        print(f"\nскачано: {stats['fetched']}, уже были: {stats['skipped']}, "
+              f"ошибок: {stats['failed']}, вытеснено: {stats['evicted']} "
+              f"за {time.perf_counter() - start:.1f} с")
+    print(f"Тайлов: {len(cache)}, {cache.total_bytes / 1024 / 1024:.1f} из {args.max_mb:g} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import io
+import os
+import time
+import sqlite3
+import argparse
+import threading
+
+from tile_cache import CACHE_DIR, OSM_URL, TILE_NAME, source_key
+
+try:
+    from kivy.core.image import Image as CoreImage
+    from kivy_garden.mapview import MapSource
+    from kivy_garden.mapview.downloader import Downloader
+except ImportError:  # импорт и бенчмарк из консоли работают и без Kivy
+    MapSource = object
+
+# === Тайлы карты одним файлом (формат MBTiles) ===
+# Вместо тысяч PNG в cache/ - одна SQLite-база с индексом по (zoom, x, y).
+# Экрану карты нужен один открытый файл, а не open() на каждый тайл.
+# В MBTiles строка y считается снизу, как и в именах файлов MapView,
+# поэтому номера тайлов переносятся как есть.
+PACK_PATH = "tiles.mbtiles"
+IMPORT_BATCH = 500
+
+
+class TilePack:
+    """Хранилище тайлов MBTiles; у каждого потока своё соединение"""
+
+    def __init__(self, path=PACK_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._db().executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+        """)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path)
+        return db
+
+    def get(self, zoom, x, row):
+        """Байты тайла или None (row - снизу, как в MapView)"""
+        found = self._db().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, row)).fetchone()
+        return found[0] if found else None
+
+    def has(self, zoom, x, row) -> bool:
+        return self._db().execute(
+            "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, row)).fetchone() is not None
+
+    def put_many(self, tiles):
+        """Добавляет тайлы [(zoom, x, row, data), ...] одной транзакцией"""
+        with self._db() as db:
+            db.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", tiles)
+
+    def set_metadata(self, **values):
+        with self._db() as db:
+            db.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                           [(name, str(value)) for name, value in values.items()])
+
+    def zoom_range(self):
+        return self._db().execute("SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles").fetchone()
+
+    def count(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+def import_cache(cache_dir=CACHE_DIR, pack_path=PACK_PATH, key=None, remove=False) -> int:
+    """Переносит тайлы из cache/ в пакет; remove=True удаляет перенесённые файлы"""
+    key = key or source_key()
+    pack = TilePack(pack_path)
+    imported = 0
+    batch, paths = [], []
+
+    def flush():
+        pack.put_many(batch)
+        if remove:
+            for path in paths:
+                os.remove(path)
+        batch.clear()
+        paths.clear()
+
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            match = TILE_NAME.match(entry.name)
+            if not match or match.group(1) != key:
+                continue
+            zoom, x, row = (int(value) for value in match.groups()[1:])
+            with open(entry.path, "rb") as f:
+                batch.append((zoom, x, row, f.read()))
+            paths.append(entry.path)
+            imported += 1
+            if len(batch) >= IMPORT_BATCH:
+                flush()
+    flush()
+
+    min_zoom, max_zoom = pack.zoom_range()
+    pack.set_metadata(name="cache import", format="png", type="baselayer",
+                      minzoom=min_zoom if min_zoom is not None else 0,
+                      maxzoom=max_zoom if max_zoom is not None else 0)
+    pack.close()
+    return imported
+
+
+class PackedMapSource(MapSource):
+    """Источник для MapView: тайлы из пакета, а чего нет - обычной загрузкой в cache/"""
+
+    def __init__(self, path=PACK_PATH, url=OSM_URL, **kwargs):
+        super().__init__(url=url, **kwargs)
+        self.pack = TilePack(path)
+
+    def fill_tile(self, tile):
+        if tile.state == "done":
+            return
+        Downloader.instance(self.cache_dir).submit(self._load_tile, tile)
+
+    def _load_tile(self, tile):
+        # Выполняется в потоке загрузчика MapView
+        data = self.pack.get(tile.zoom, tile.tile_x, tile.tile_y)
+        if data is None:
+            return self._fallback, (tile,)
+        image = CoreImage(io.BytesIO(data), ext="png",
+                          filename=f"{tile.zoom}.{tile.tile_x}.{tile.tile_y}.png")
+        return self._load_tile_done, (tile, image)
+
+    def _load_tile_done(self, tile, image):
+        tile.texture = image.texture
+        tile.state = "need-animation"
+
+    def _fallback(self, tile):
+        super().fill_tile(tile)
+
+
+def get_map_source(path=PACK_PATH):
+    """Пакет тайлов, если он уже собран, иначе стандартный источник MapView"""
+    return PackedMapSource(path) if os.path.exists(path) else "osm"
+
+
+def _drop_page_cache(paths):
+    """Просит ОС выбросить файлы из страничного кэша (только Linux), чтобы замерить холодное чтение"""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def benchmark(cache_dir=CACHE_DIR, pack_path=PACK_PATH, rounds=20, cold=False):
+    """Чтение всех тайлов из отдельных файлов и из пакета; файлы и место на диске.
+    cold=True - перед каждым проходом файлы выбрасываются из кэша ОС"""
+    if cold and not hasattr(os, "posix_fadvise"):
+        print("Холодный замер работает только на Linux")
+        return
+    files = [entry.path for entry in os.scandir(cache_dir) if TILE_NAME.match(entry.name)]
+    if not files:
+        print(f"В {cache_dir} нет тайлов")
+        return
+    keys = []
+    for path in files:
+        zoom, x, row = (int(value) for value in TILE_NAME.match(os.path.basename(path)).groups()[1:])
+        keys.append((zoom, x, row))
+
+    loose = 0.0
+    for _ in range(rounds):
+        if cold:
+            _drop_page_cache(files)
+        start = time.perf_counter()
+        for path in files:
+            with open(path, "rb") as f:
+                f.read()
+        loose += (time.perf_counter() - start) / rounds
+
+    packed = 0.0
+    for _ in range(rounds):
+        if cold:
+            _drop_page_cache([pack_path])
+        start = time.perf_counter()
+        pack = TilePack(pack_path)  # открытие базы тоже считается, как открытие файлов выше
+        for key in keys:
+            pack.get(*key)
+        packed += (time.perf_counter() - start) / rounds
+        pack.close()
+
+    disk = sum(os.stat(path).st_blocks * 512 for path in files)
+    print(f"тайлов: {len(files)}, {'холодный' if cold else 'тёплый'} кэш ОС")
+    print(f"  файлы:  {loose * 1000:.2f} мс на все тайлы, {len(files)} файлов, {disk / 1024:.0f} КБ на диске")
+    print(f"  пакет:  {packed * 1000:.2f} мс на все тайлы, 1 файл, "
+          f"{os.stat(pack_path).st_blocks * 512 / 1024:.0f} КБ на диске")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакет тайлов MBTiles")
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--pack", default=PACK_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="перенести тайлы из cache/ в пакет")
+    imp.add_argument("--remove", action="store_true", help="удалить перенесённые файлы")
+    bench = sub.add_parser("bench", help="сравнить чтение из файлов и из пакета")
+    bench.add_argument("--cold", action="store_true", help="перед каждым проходом выбросить файлы из кэша ОС")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f"Перенесено тайлов: {import_cache(args.cache, args.pack, remove=args.remove)}")
+    else:
+        benchmark(args.cache, args.pack, cold=args.cold)
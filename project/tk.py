@@ -1,12 +1,42 @@
 import tkinter as tk
 from tkinter import filedialog
-from PIL import Image
-import torch
-import clip
 
-# Загружаем модель CLIP
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
+from food_classifier import get_classifier
+
+# Модель CLIP грузится в фоне при первом нажатии на кнопку
+# (с FOOD_SERVER=host:port проверяет общий сервер, см. food_server.py)
+classifier = get_classifier()
+clip_provider = classifier.provider
+
+VERDICTS = {
+    "edible": "✅ Эту еду можно есть!",
+    "not_edible": "❌ Эту еду есть нельзя!",
+    "not_food": "🚫 Это вообще не еда!",
+}
+
+# Нажатие на кнопку: сначала дожидаемся модели, потом анализ
+def on_button():
+    if clip_provider.ready:
+        analyze_image()
+        return
+
+    clip_provider.start()  # после ошибки - новая попытка загрузки
+    btn.config(state="disabled")
+    result_label.config(text="Модель прогревается, подождите...")
+    root.after(100, wait_for_model)
+
+# Проверяем готовность модели (tkinter нельзя трогать из фонового потока)
+def wait_for_model():
+    if clip_provider.state == "warming":
+        root.after(100, wait_for_model)
+        return
+
+    btn.config(state="normal")
+    if clip_provider.error is not None:
+        result_label.config(text=f"Не удалось загрузить модель: {clip_provider.error}\nНажмите кнопку, чтобы попробовать снова")
+        return
+    result_label.config(text=f"Модель готова (загрузка {clip_provider.metrics['total_seconds']:.1f} с)")
+    analyze_image()
 
 # Функция обработки изображения
 def analyze_image():
@@ -15,42 +45,14 @@ def analyze_image():
     if not file_path:
         return
     
-    # Загружаем и обрабатываем изображение
-    image = preprocess(Image.open(file_path)).unsqueeze(0).to(device)
-    
-    # Список текстовых описаний
-    text_descriptions = [
-        "not food",
-        "fresh food",
-        "edible food",
-        "tasty food",
-        "rotten food",
-        "food with mold"
-    ]
-    text_tokens = clip.tokenize(text_descriptions).to(device)
-    
-    # Получаем сходство
-    with torch.no_grad():
-        image_features = model.encode_image(image)
-        text_features = model.encode_text(text_tokens)
-        image_features /= image_features.norm(dim=-1, keepdim=True)
-        text_features /= text_features.norm(dim=-1, keepdim=True)
-        similarity = (image_features @ text_features.T).squeeze(0)
-    
-    # Находим наиболее подходящее описание
-    best_idx = similarity.argmax().item()
-    best_label = text_descriptions[best_idx]
-
-    # Сначала выводим, что думает CLIP
-    clip_text = f"CLIP считает, что это: {best_label}\n"
+    # Получаем вердикт (из кэша, если это фото уже проверяли)
+    prediction = classifier.classify(file_path)
 
-    # Потом даём решение
-    if "fresh" in best_label or "edible" in best_label or "tasty" in best_label:
-        result_text = "✅ Эту еду можно есть!"
-    elif "rotten" in best_label or "mold" in best_label:
-        result_text = "❌ Эту еду есть нельзя!"
-    else:
-        result_text = "🚫 Это вообще не еда!"
+    # Сначала выводим, что думает CLIP, потом даём решение
+    clip_text = f"CLIP считает, что это: {prediction.label}\n"
+    result_text = VERDICTS.get(prediction.verdict, prediction.text)
+    if prediction.confidence is not None:
+        result_text += f"\nУверенность: {prediction.confidence:.0%}"
 
     # Выводим всё вместе
     result_label.config(text=clip_text + result_text)
@@ -60,7 +62,7 @@ root = tk.Tk()
 root.title("Food Safety Checker")
 
 # Кнопка для выбора и анализа изображения
-btn = tk.Button(root, text="Загрузить фото еды", command=analyze_image, font=("Arial", 12))
+btn = tk.Button(root, text="Загрузить фото еды", command=on_button, font=("Arial", 12))
 btn.pack(pady=20)
 
 # Место для вывода результата
@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import threading
+
+# === Хранилище пользователей (SQLite вместо users.txt) ===
+# Логин - первичный ключ, поэтому вход и регистрация не читают весь файл,
+# а проверка "логин занят" и вставка происходят одной атомарной операцией.
+DB_PATH = "users.db"
+LEGACY_FILE = "users.txt"
+
+# В старом формате каждая строка - "login:sha256". Из-за гонки при записи
+# встречаются склеенные строки вида "a:<hash>b:<hash>", поэтому ищем все пары.
+LEGACY_RECORD = re.compile(r"([^:\r\n]+?):([0-9a-f]{64})")
+
+
+def parse_legacy(path=LEGACY_FILE):
+    """Читает users.txt и возвращает список (login, password) без дублей"""
+    users = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            for login, password in LEGACY_RECORD.findall(line.strip()):
+                users.setdefault(login, password)  # как и раньше, первая запись главнее
+    return list(users.items())
+
+
+class UserStore:
+    """Пользователи в SQLite с уникальным индексом по логину"""
+
+    def __init__(self, path=DB_PATH, legacy_path=LEGACY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                login TEXT PRIMARY KEY,
+                password TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        if legacy_path and os.path.exists(legacy_path) and not self._meta("migrated_users_txt"):
+            self.migrate(legacy_path)
+
+    def _meta(self, key):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def migrate(self, legacy_path=LEGACY_FILE) -> int:
+        """Одноразовый перенос пользователей из users.txt, возвращает число добавленных"""
+        users = parse_legacy(legacy_path)
+        now = time.time()
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO users (login, password, created_at) VALUES (?, ?, ?)",
+                [(login, password, now) for login, password in users])
+            added = self._db.total_changes - before
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_users_txt', ?)",
+                (str(now),))
+        return added
+
+    def add(self, login: str, password: str) -> bool:
+        """Добавляет пользователя; False, если логин уже занят"""
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT INTO users (login, password, created_at) VALUES (?, ?, ?)",
+                    (login, password, time.time()))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def get_password(self, login: str):
+        """Сохранённый хэш пароля или None"""
+        with self._lock:
+            row = self._db.execute("SELECT password FROM users WHERE login = ?", (login,)).fetchone()
+        return row[0] if row else None
+
+    def set_password(self, login: str, password: str):
+        with self._lock, self._db:
+            self._db.execute("UPDATE users SET password = ? WHERE login = ?", (password, login))
+
+    def check(self, login: str, password: str) -> bool:
+        return self.get_password(login) == password
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store = None
+
+
+def get_store() -> UserStore:
+    global _store
+    if _store is None:
+        _store = UserStore()
+    return _store
+
+
+# === Старый API (как в msngr.py / progauth.py / reg.py) ===
+def add_user(login: str, password: str) -> bool:
+    """Добавляет пользователя"""
+    return get_store().add(login, password)
+
+
+def get_user(login: str, password: str) -> bool:
+    """Проверяет логин и пароль пользователя"""
+    return get_store().check(login, password)
+
+
+if __name__ == "__main__":
+    # python user_store.py [users.txt] - принудительно перенести пользователей
+    legacy = sys.argv[1] if len(sys.argv) > 1 else LEGACY_FILE
+    store = UserStore(legacy_path=None)
+    print(f"Перенесено пользователей: {store.migrate(legacy)} (всего в базе: {store.count()})")